@@ -0,0 +1,174 @@
+"""End-to-end campaign throughput benchmark against offline Google API fakes.
+
+Runs a whole campaign (initial sends, reply detection, follow-ups and sheet
+write-back) through the real Celery tasks, with Gmail, Sheets and Drive replaced
+by the fakes in benchmarks/fakes.py and the database in memory. Celery runs
+eagerly in this process; countdown and scheduled tasks are queued locally and
+simulated time is advanced between phases instead of waiting.
+
+    python -m benchmarks.campaign_throughput --contacts 2000 --latency 0.05 --fake-redis
+
+Without --fake-redis the benchmark uses the Redis server at REDIS_URL.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import timedelta
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=500, help='rows in the contact sheet')
+    parser.add_argument('--worksheets', type=int, default=1, help='worksheets the contacts are spread over')
+    parser.add_argument('--followups', type=int, default=2, help='follow-ups per contact that never replies')
+    parser.add_argument('--reply-rate', type=float, default=0.2, help='fraction of contacts that reply after each email')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake API round trip')
+    parser.add_argument('--bounce-rate', type=float, default=0.0, help='fraction of addresses that hard-bounce (half in their own thread, half in a new one)')
+    parser.add_argument('--auto-reply-rate', type=float, default=0.0, help='fraction of contacts that send an out-of-office reply to the first email')
+    parser.add_argument('--quota-error-rate', type=float, default=0.0, help='probability that an API call fails with 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rate-limits', action='store_true', help='keep the production Google API rate limits (slow: sends run at ~2/s)')
+    parser.add_argument('--fake-redis', action='store_true', help='use an in-process fakeredis server instead of REDIS_URL')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser.parse_args(argv)
+
+def use_fake_redis():
+    # Must run before outreach_pilot is imported, since extensions.py connects at import time.
+    try: import fakeredis
+    except ImportError: sys.exit("--fake-redis needs the fakeredis package (pip install fakeredis lupa).")
+    import redis
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+
+class TaskQueue:
+    """Collects tasks published with apply_async/delay/send_task so the benchmark can run them in order.
+
+    Tasks published with a countdown are held back until the simulated clock moves.
+    """
+    def __init__(self, celery):
+        self.celery = celery; self.pending = []; self.deferred = []; self.executed = 0
+
+    def publish(self, name, args=None, kwargs=None, countdown=None, **options):
+        (self.deferred if countdown else self.pending).append((name, list(args or []), kwargs or {}))
+
+    def install(self, module):
+        for task in self.celery.tasks.values():
+            if not task.name.startswith(module.__name__ + '.'): continue
+            task.apply_async = lambda args=None, kwargs=None, _name=task.name, **options: self.publish(_name, args, kwargs, **options)
+            task.delay = lambda *args, _name=task.name, **kwargs: self.pending.append((_name, list(args), kwargs))
+        self.celery.send_task = self.publish
+
+    def run_tick(self):
+        """Run everything queued so far; tasks queued while running wait for the next tick."""
+        current, self.pending = self.pending, []
+        for name, args, kwargs in current:
+            self.celery.tasks[name].run(*args, **kwargs); self.executed += 1
+        return len(current)
+
+    def drain(self):
+        while self.run_tick(): pass
+
+    def release_deferred(self):
+        self.pending.extend(self.deferred); self.deferred = []
+
+def advance_clock(db, models, queue, seconds):
+    """Move every schedule and wait period back in time instead of sleeping."""
+    queue.release_deferred()
+    for action in models.ScheduledAction.query.all(): action.due_at -= timedelta(seconds=seconds)
+    for contact in models.Contact.query.filter(models.Contact.wait_started_at.isnot(None)):
+        contact.wait_started_at -= timedelta(seconds=seconds)
+    db.session.commit()
+
+def build_workbook(google, contacts, worksheets):
+    headers = ['Name', 'Email', 'Company']; sheets = {}
+    for index in range(worksheets):
+        rows = [headers] + [[f"Contact {n}", f"contact{n}@example.com", f"Company {n % 97}"] for n in range(index, contacts, worksheets)]
+        sheets[f"Sheet{index + 1}"] = rows
+    return google.sheets.create_spreadsheet('benchmark-sheet', 'Benchmark contacts', sheets)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.fake_redis: use_fake_redis()
+    if not args.rate_limits:
+        for api in ('gmail_send', 'gmail_read', 'sheets_write', 'sheets_read'): os.environ.setdefault(f"RATE_LIMIT_{api.upper()}", '1000000')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import Config
+    from outreach_pilot import create_app, models
+    from outreach_pilot import tasks
+    from outreach_pilot.extensions import db
+    from outreach_pilot.campaign_cache import get_campaign_settings
+    from outreach_pilot.credential_store import save_credentials
+    from benchmarks.fakes import FakeGoogle
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+    os.environ.pop('FLASK_ENV', None)
+    app = create_app(BenchmarkConfig); app.app_context().push(); db.create_all()
+    tasks.celery.conf.update(task_always_eager=True, broker_url='memory://', result_backend='cache+memory://')
+    google = FakeGoogle(latency=args.latency, quota_error_rate=args.quota_error_rate, seed=args.seed)
+    tasks.get_gmail_service = lambda credentials: google.gmail
+    tasks.get_gspread_client = lambda credentials: google.sheets
+    queue = TaskQueue(tasks.celery); queue.install(tasks)
+
+    workbook = build_workbook(google, args.contacts, args.worksheets)
+    wait_seconds = 3 * 86400; scan_seconds = 4 * 3600
+    app.config.update(GOOGLE_CLIENT_ID='benchmark', GOOGLE_CLIENT_SECRET='benchmark')
+    save_credentials('bench@example.com', {'refresh_token': 'benchmark', 'token_uri': 'https://oauth2.googleapis.com/token', 'scopes': []})
+    campaign = models.Campaign(user_email='bench@example.com', g_sheet_id=workbook.id,
+                               column_mappings=json.dumps({ws.title: {'name': 'Name', 'email': 'Email'} for ws in workbook.worksheets()}),
+                               num_followups=args.followups, total_wait_seconds=wait_seconds, check_frequency_seconds=scan_seconds, use_random_followups=False)
+    campaign.templates = [models.CampaignTemplate(position=i, subject=f"Step {i}", body=f"<p>Hi {{name}}, message {i}.</p>") for i in range(args.followups + 1)]
+    db.session.add(campaign); db.session.commit(); get_campaign_settings.cache_clear()
+
+    phases = []
+    def phase(name, fn):
+        calls_before = google.total_calls(); tasks_before = queue.executed; started = time.perf_counter()
+        fn()
+        phases.append({'phase': name, 'seconds': round(time.perf_counter() - started, 3), 'api_calls': google.total_calls() - calls_before, 'tasks': queue.executed - tasks_before})
+
+    def send_initial():
+        tasks.start_outreach_campaign.run(campaign.id); queue.drain()
+        for contact in models.Contact.query.filter(models.Contact.thread_id.isnot(None)):
+            roll = google.random.random()
+            if roll < args.bounce_rate: google.gmail.simulate_bounce(contact.thread_id, contact.email, same_thread=roll < args.bounce_rate / 2)
+            elif roll < args.bounce_rate + args.auto_reply_rate: google.gmail.simulate_auto_reply(contact.thread_id, sender=contact.email)
+
+    def reply_round():
+        waiting = models.Contact.query.filter(models.Contact.status.notin_(tasks.FINISHED_STATUSES), models.Contact.thread_id.isnot(None)).all()
+        for contact in waiting:
+            if google.random.random() < args.reply_rate: google.gmail.simulate_reply(contact.thread_id, sender=contact.email)
+        advance_clock(db, models, queue, scan_seconds); tasks.dispatch_due_actions.run(); queue.drain()
+
+    def follow_up_round():
+        advance_clock(db, models, queue, wait_seconds); tasks.dispatch_due_actions.run(); queue.drain()
+
+    started = time.perf_counter()
+    phase('initial send', send_initial)
+    for round_number in range(args.followups + 1):
+        phase(f"replies {round_number}", reply_round)
+        phase(f"follow-ups {round_number + 1}" if round_number < args.followups else 'completion', follow_up_round)
+    phase('final flush', lambda: (advance_clock(db, models, queue, scan_seconds), tasks.dispatch_due_actions.run(), queue.drain()))
+    wall_seconds = time.perf_counter() - started
+
+    statuses = dict(db.session.query(models.Contact.status, db.func.count()).group_by(models.Contact.status).all())
+    emails_sent = google.calls['gmail.messages.send[batched]'] + google.calls['gmail.messages.send']
+    report = {
+        'contacts': args.contacts, 'latency': args.latency, 'quota_error_rate': args.quota_error_rate,
+        'wall_seconds': round(wall_seconds, 3), 'emails_sent': emails_sent,
+        'initial_sends_per_second': round(args.contacts / phases[0]['seconds'], 1) if phases[0]['seconds'] else None,
+        'api_calls': google.total_calls(), 'api_calls_per_contact': round(google.total_calls() / max(args.contacts, 1), 3),
+        'calls_by_api': dict(sorted(google.calls.items())), 'statuses': statuses, 'phases': phases,
+    }
+    if args.json: print(json.dumps(report, indent=2)); return report
+    print(f"\n{args.contacts} contacts, {args.latency * 1000:.0f} ms latency, {args.quota_error_rate:.0%} quota errors")
+    print(f"Wall time {report['wall_seconds']} s, {emails_sent} emails, {report['initial_sends_per_second']} initial sends/s")
+    print(f"{report['api_calls']} API calls ({report['api_calls_per_contact']} per contact)")
+    for item in phases: print(f"  {item['phase']:<14} {item['seconds']:>8.3f} s {item['api_calls']:>7} calls {item['tasks']:>6} tasks")
+    for name, count in report['calls_by_api'].items(): print(f"  {name:<40} {count}")
+    print(f"  statuses: {statuses}")
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""In-memory stand-ins for the Gmail, Sheets and Drive clients used by Outreach Pilot.
+
+The fakes implement only the calls the application makes, with the same
+shapes as googleapiclient resources and gspread objects, so tasks and views run
+unchanged against them. Every API call, including each part of a batch request,
+is counted in `FakeGoogle.calls` and can be slowed down (`latency`) or fail with
+a quota error (`quota_error_rate`).
+"""
+import re
+import json
+import time
+import base64
+import random
+import itertools
+import threading
+from collections import Counter
+import httplib2
+import requests
+from googleapiclient.errors import HttpError
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+
+class FakeGoogle:
+    """Shared state, call counters and fault injection for all fake services."""
+    def __init__(self, latency=0.0, quota_error_rate=0.0, seed=0):
+        self.latency = latency; self.quota_error_rate = quota_error_rate
+        self.random = random.Random(seed); self.calls = Counter(); self._lock = threading.Lock()
+        self.gmail = FakeGmailService(self); self.drive = FakeDriveService(self); self.sheets = FakeSheetsClient(self)
+
+    def round_trip(self, name, error_factory):
+        with self._lock:
+            self.calls[name] += 1
+            failed = self.quota_error_rate and self.random.random() < self.quota_error_rate
+            if failed: self.calls[f"{name}:quota_error"] += 1
+        if self.latency: time.sleep(self.latency)
+        if failed: raise error_factory()
+
+    def total_calls(self, prefix=''):
+        return sum(count for name, count in self.calls.items() if name.startswith(prefix) and ':' not in name)
+
+def gmail_quota_error():
+    content = json.dumps({'error': {'code': 429, 'message': 'User-rate limit exceeded', 'errors': [{'reason': 'rateLimitExceeded'}]}}).encode()
+    return HttpError(httplib2.Response({'status': 429}), content)
+
+def sheets_quota_error():
+    response = requests.Response(); response.status_code = 429
+    response._content = json.dumps({'error': {'code': 429, 'message': 'Quota exceeded for quota metric', 'status': 'RESOURCE_EXHAUSTED'}}).encode()
+    return APIError(response)
+
+class FakeRequest:
+    def __init__(self, google, name, handler, error_factory=gmail_quota_error):
+        self.google = google; self.name = name; self.handler = handler; self.error_factory = error_factory
+
+    def execute(self, num_retries=0):
+        self.google.round_trip(self.name, self.error_factory)
+        return self.handler()
+
+class FakeBatchRequest:
+    def __init__(self, google, callback):
+        self.google = google; self.callback = callback; self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self):
+        self.google.round_trip('gmail.batch', gmail_quota_error)
+        for request_id, request, callback in self.requests:
+            # Batched parts share the outer round trip but are still metered and throttled one by one.
+            try:
+                with self.google._lock:
+                    self.google.calls[f"{request.name}[batched]"] += 1
+                    failed = self.google.quota_error_rate and self.google.random.random() < self.google.quota_error_rate
+                if failed: raise request.error_factory()
+                callback(request_id, request.handler(), None)
+            except HttpError as e: callback(request_id, None, e)
+
+class FakeGmailService:
+    def __init__(self, google, email_address='sender@example.com'):
+        self.google = google; self.email_address = email_address
+        self.threads_by_id = {}; self.history_records = []; self.history_id = 1000; self._ids = itertools.count(1)
+        self._users = FakeGmailUsers(self)
+
+    def users(self): return self._users
+    def new_batch_http_request(self, callback=None): return FakeBatchRequest(self.google, callback)
+
+    def add_message(self, thread_id, sender, body, label_ids, headers=None):
+        message_id = f"msg{next(self._ids)}"; self.history_id += 1
+        data = base64.urlsafe_b64encode(body.encode()).decode()
+        all_headers = [{'name': 'From', 'value': sender}, {'name': 'Subject', 'value': 'Re: outreach'}] + list(headers or [])
+        message = {'id': message_id, 'threadId': thread_id, 'labelIds': label_ids, 'historyId': str(self.history_id), 'snippet': body[:100], 'internalDate': str(int(time.time() * 1000)),
+                   'payload': {'mimeType': 'multipart/alternative', 'headers': all_headers, 'parts': [{'mimeType': 'text/plain', 'body': {'data': data}}]}}
+        self.threads_by_id.setdefault(thread_id, []).append(message)
+        self.history_records.append({'id': str(self.history_id), 'messagesAdded': [{'message': {'id': message_id, 'threadId': thread_id, 'labelIds': label_ids}}]})
+        return message
+
+    def simulate_reply(self, thread_id, body="Thanks, this sounds great. Let's talk next week.", sender='contact@example.com', headers=None):
+        return self.add_message(thread_id, sender, body, ['INBOX', 'UNREAD'], headers)
+
+    def simulate_bounce(self, thread_id, recipient, same_thread=True):
+        """Deliver a hard-bounce DSN for `recipient`, in its thread or in a new one as some servers do."""
+        headers = [{'name': 'Content-Type', 'value': 'multipart/report; report-type=delivery-status; boundary="b"'},
+                   {'name': 'Auto-Submitted', 'value': 'auto-replied'}, {'name': 'X-Failed-Recipients', 'value': recipient}]
+        if not same_thread: thread_id = f"thread{next(self._ids)}"
+        return self.add_message(thread_id, 'Mail Delivery Subsystem <mailer-daemon@googlemail.com>', f"Address not found: {recipient}", ['INBOX', 'UNREAD'], headers)
+
+    def simulate_auto_reply(self, thread_id, sender='contact@example.com'):
+        return self.add_message(thread_id, sender, "I am out of the office until Monday.", ['INBOX', 'UNREAD'], [{'name': 'Auto-Submitted', 'value': 'auto-replied'}])
+
+class FakeGmailUsers:
+    def __init__(self, service):
+        self.service = service; self.google = service.google
+        self._messages = FakeGmailMessages(service); self._threads = FakeGmailThreads(service); self._history = FakeGmailHistory(service)
+
+    def getProfile(self, userId='me'):
+        return FakeRequest(self.google, 'gmail.users.getProfile', lambda: {'emailAddress': self.service.email_address, 'historyId': str(self.service.history_id)})
+
+    def messages(self): return self._messages
+    def threads(self): return self._threads
+    def history(self): return self._history
+
+def format_message(message, format='full', metadataHeaders=None):
+    if format == 'full': return message
+    trimmed = {key: value for key, value in message.items() if key != 'payload'}
+    if format == 'metadata':
+        headers = message['payload']['headers']
+        if metadataHeaders: headers = [h for h in headers if h['name'].lower() in {name.lower() for name in metadataHeaders}]
+        trimmed['payload'] = {'mimeType': message['payload']['mimeType'], 'headers': headers}
+    return trimmed
+
+class FakeGmailMessages:
+    def __init__(self, service): self.service = service; self.google = service.google
+
+    def send(self, userId='me', body=None):
+        def handler():
+            thread_id = body.get('threadId') or f"thread{next(self.service._ids)}"
+            message = self.service.add_message(thread_id, self.service.email_address, '(sent)', ['SENT'])
+            return {'id': message['id'], 'threadId': thread_id, 'labelIds': ['SENT']}
+        return FakeRequest(self.google, 'gmail.messages.send', handler)
+
+    def get(self, userId='me', id=None, format='full', metadataHeaders=None, fields=None):
+        def handler():
+            for messages in self.service.threads_by_id.values():
+                for message in messages:
+                    if message['id'] == id: return format_message(message, format, metadataHeaders)
+            raise HttpError(httplib2.Response({'status': 404}), b'{"error": {"code": 404, "message": "Not Found"}}')
+        return FakeRequest(self.google, 'gmail.messages.get', handler)
+
+    def list(self, userId='me', q='', pageToken=None, maxResults=100, fields=None):
+        # Understands the two search terms the app uses: a from:(a OR b) sender filter and after:<epoch seconds>.
+        def handler():
+            senders = re.search(r'from:\(([^)]*)\)', q or ''); after = re.search(r'after:(\d+)', q or '')
+            names = [name.strip().lower() for name in senders.group(1).split(' OR ')] if senders else []
+            matches = []
+            for messages in self.service.threads_by_id.values():
+                for message in messages:
+                    sender = next((h['value'] for h in message['payload']['headers'] if h['name'] == 'From'), '').lower()
+                    if names and not any(name in sender for name in names): continue
+                    if after and int(message['internalDate']) // 1000 < int(after.group(1)): continue
+                    matches.append({'id': message['id'], 'threadId': message['threadId']})
+            offset = int(pageToken or 0); response = {'messages': matches[offset:offset + maxResults]}
+            if offset + maxResults < len(matches): response['nextPageToken'] = str(offset + maxResults)
+            return response
+        return FakeRequest(self.google, 'gmail.messages.list', handler)
+
+class FakeGmailThreads:
+    def __init__(self, service): self.service = service; self.google = service.google
+
+    def get(self, userId='me', id=None, format='full', metadataHeaders=None, fields=None):
+        def handler():
+            if id not in self.service.threads_by_id: raise HttpError(httplib2.Response({'status': 404}), b'{"error": {"code": 404, "message": "Not Found"}}')
+            messages = self.service.threads_by_id[id]
+            return {'id': id, 'historyId': messages[-1]['historyId'], 'messages': [format_message(m, format, metadataHeaders) for m in messages]}
+        return FakeRequest(self.google, 'gmail.threads.get', handler)
+
+class FakeGmailHistory:
+    PAGE_SIZE = 500
+
+    def __init__(self, service): self.service = service; self.google = service.google
+
+    def list(self, userId='me', startHistoryId=None, historyTypes=None, pageToken=None, maxResults=None):
+        def handler():
+            records = [r for r in self.service.history_records if int(r['id']) > int(startHistoryId)]
+            offset = int(pageToken or 0); page = records[offset:offset + self.PAGE_SIZE]
+            response = {'history': page, 'historyId': str(self.service.history_id)}
+            if offset + self.PAGE_SIZE < len(records): response['nextPageToken'] = str(offset + self.PAGE_SIZE)
+            return response
+        return FakeRequest(self.google, 'gmail.users.history.list', handler)
+
+class FakeDriveService:
+    def __init__(self, google):
+        self.google = google; self.spreadsheets = []; self._files = FakeDriveFiles(self)
+
+    def files(self): return self._files
+
+class FakeDriveFiles:
+    def __init__(self, service): self.service = service
+
+    def list(self, q=None, pageSize=100, fields=None, pageToken=None, orderBy=None):
+        def handler():
+            offset = int(pageToken or 0); files = self.service.spreadsheets[offset:offset + pageSize]
+            response = {'files': [{'id': f['id'], 'name': f['name']} for f in files]}
+            if offset + pageSize < len(self.service.spreadsheets): response['nextPageToken'] = str(offset + pageSize)
+            return response
+        return FakeRequest(self.service.google, 'drive.files.list', handler)
+
+class FakeSheetsClient:
+    """Stands in for an authorized gspread client."""
+    def __init__(self, google): self.google = google; self.spreadsheets = {}
+
+    def create_spreadsheet(self, spreadsheet_id, title, worksheets):
+        spreadsheet = FakeSpreadsheet(self.google, spreadsheet_id, title)
+        for worksheet_title, rows in worksheets.items(): spreadsheet.add_worksheet(worksheet_title, rows)
+        self.spreadsheets[spreadsheet_id] = spreadsheet
+        self.google.drive.spreadsheets.append({'id': spreadsheet_id, 'name': title})
+        return spreadsheet
+
+    def open_by_key(self, key):
+        self.google.round_trip('sheets.spreadsheets.get', sheets_quota_error)
+        return self.spreadsheets[key]
+
+class FakeSpreadsheet:
+    def __init__(self, google, spreadsheet_id, title):
+        self.google = google; self.id = spreadsheet_id; self.title = title; self._worksheets = {}
+
+    def add_worksheet(self, title, rows):
+        self._worksheets[title] = FakeWorksheet(self, title, [list(map(str, row)) for row in rows])
+        return self._worksheets[title]
+
+    def worksheet(self, title):
+        if title not in self._worksheets: raise WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def worksheets(self): return list(self._worksheets.values())
+
+    def values_batch_get(self, ranges, params=None):
+        self.google.round_trip('sheets.values.batchGet', sheets_quota_error)
+        value_ranges = []
+        for range_name in ranges:
+            title, _, cells = range_name.rpartition('!')
+            worksheet = self._worksheets[title[1:-1].replace("''", "'") if title.startswith("'") else title]
+            value_ranges.append({'range': range_name, 'values': worksheet._read(cells)})
+        return {'spreadsheetId': self.id, 'valueRanges': value_ranges}
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows):
+        self.spreadsheet = spreadsheet; self.google = spreadsheet.google; self.title = title; self.rows = rows
+
+    @property
+    def spreadsheet_id(self): return self.spreadsheet.id
+    @property
+    def row_count(self): return max(len(self.rows), 1000)
+    @property
+    def col_count(self): return max([len(row) for row in self.rows] + [26])
+
+    def _call(self, name): self.google.round_trip(f"sheets.{name}", sheets_quota_error)
+
+    def _cell(self, row, col):
+        return self.rows[row - 1][col - 1] if row <= len(self.rows) and col <= len(self.rows[row - 1]) else ''
+
+    def _read(self, cells):
+        """Read an A1 range such as '1:1', 'C7' or 'A2:F500'."""
+        match = re.fullmatch(r'(\d+):(\d+)', cells)
+        if match: return [list(row) for row in self.rows[int(match[1]) - 1:int(match[2])]]
+        start, _, end = cells.partition(':')
+        start_row, start_col = a1_to_rowcol(start); end_row, end_col = a1_to_rowcol(end) if end else (start_row, start_col)
+        values = []
+        for row in range(start_row, min(end_row, len(self.rows)) + 1):
+            values.append([self._cell(row, col) for col in range(start_col, min(end_col, len(self.rows[row - 1])) + 1)])
+        while values and not any(values[-1]): values.pop()
+        return values
+
+    def _write(self, row, col, value):
+        while len(self.rows) < row: self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col: cells.append('')
+        cells[col - 1] = str(value)
+
+    def get_all_values(self):
+        self._call('values.get'); return [list(row) for row in self.rows]
+
+    def get_all_records(self, head=1, **kwargs):
+        self._call('values.get'); headers = self.rows[head - 1]; records = []
+        for row in self.rows[head:]:
+            records.append({header: (row[i] if i < len(row) else '') for i, header in enumerate(headers)})
+        return records
+
+    def get(self, range_name=None, **kwargs):
+        self._call('values.get'); return self._read(range_name)
+
+    def row_values(self, row):
+        self._call('values.get'); return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        self._call('values.get'); return [row[col - 1] if col <= len(row) else '' for row in self.rows]
+
+    def find(self, query, in_row=None, in_column=None, case_sensitive=True):
+        # gspread reads the whole sheet and searches it client-side.
+        self._call('values.get')
+        for row_number, row in enumerate(self.rows, start=1):
+            for col_number, value in enumerate(row, start=1):
+                if value == query: return FakeCell(row_number, col_number, value)
+        return None
+
+    def batch_get(self, ranges, **kwargs):
+        self._call('values.batchGet'); return [self._read(cells) for cells in ranges]
+
+    def update_cells(self, cell_list, value_input_option='RAW'):
+        self._call('values.update')
+        for cell in cell_list: self._write(cell.row, cell.col, cell.value)
+
+    def update_cell(self, row, col, value):
+        self._call('values.update'); self._write(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        self._call('values.batchUpdate')
+        for item in data:
+            row, col = a1_to_rowcol(item['range'].split(':')[0])
+            for row_offset, values in enumerate(item['values']):
+                for col_offset, value in enumerate(values): self._write(row + row_offset, col + col_offset, value)
+
+class FakeCell:
+    def __init__(self, row, col, value): self.row = row; self.col = col; self.value = value
@@ -0,0 +1,68 @@
+"""Worker cold-start benchmark.
+
+Starts fresh interpreters that import celery_worker the way `celery -A
+celery_worker.celery worker` does, then build the app context the first task
+runs in. Reports the median time to import and to the first task context, and
+which heavy libraries were loaded at import. Those libraries should only load
+when a task first needs them.
+
+    python -m benchmarks.worker_startup --runs 5 --max-import-seconds 1.0
+
+Exits with status 1 if the import takes longer than --max-import-seconds or
+loads any of the heavy libraries, so it can be used as a regression check.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Libraries a worker should not load until a task needs them.
+HEAVY_MODULES = ('gspread', 'googleapiclient.discovery', 'google_auth_oauthlib', 'google.oauth2.credentials', 'httplib2', 'vaderSentiment', 'email.mime.multipart')
+
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import celery_worker
+imported = time.perf_counter()
+from sqlalchemy import text
+from outreach_pilot.extensions import db
+with celery_worker.get_app().app_context(): db.session.execute(text('SELECT 1'))
+ready = time.perf_counter()
+print(json.dumps({'import_seconds': imported - started, 'first_task_seconds': ready - started, 'heavy_modules': [name for name in %r if name in sys.modules]}))
+"""
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to start')
+    parser.add_argument('--max-import-seconds', type=float, default=None, help='fail if the median import time exceeds this')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser.parse_args(argv)
+
+def run_probe():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, FLASK_ENV='development', DEV_DATABASE_URL='sqlite://', PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run([sys.executable, '-c', PROBE % (HEAVY_MODULES,)], cwd=root, env=env, capture_output=True, text=True)
+    if result.returncode: sys.exit(f"Startup probe failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    args = parse_args(argv)
+    samples = [run_probe() for _ in range(args.runs)]
+    report = {
+        'runs': args.runs,
+        'import_seconds': round(statistics.median(s['import_seconds'] for s in samples), 3),
+        'first_task_seconds': round(statistics.median(s['first_task_seconds'] for s in samples), 3),
+        'heavy_modules': sorted({name for s in samples for name in s['heavy_modules']}),
+    }
+    failed = bool(report['heavy_modules']) or (args.max_import_seconds is not None and report['import_seconds'] > args.max_import_seconds)
+    if args.json: print(json.dumps(report, indent=2))
+    else:
+        print(f"Median over {args.runs} runs: import {report['import_seconds']} s, first task context {report['first_task_seconds']} s")
+        print(f"Heavy modules loaded at import: {', '.join(report['heavy_modules']) or 'none'}")
+    if failed: sys.exit(1)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,19 @@
 import os
+import threading
 from outreach_pilot import create_app
 from outreach_pilot.tasks import celery
 
-# Use the app factory to create a Flask app instance
-app = create_app()
+# The Flask app is built when the first task runs rather than at import, and
+# without the web blueprints, so a worker woken from zero starts consuming sooner.
+_app = None
+_app_lock = threading.Lock()
+
+def get_app():
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None: _app = create_app(with_views=False)
+    return _app
 
 # Update Celery configuration
 celery.conf.update(
@@ -21,7 +31,7 @@ TaskBase = celery.Task
 class ContextTask(TaskBase):
     abstract = True
     def __call__(self, *args, **kwargs):
-        with app.app_context():
+        with get_app().app_context():
             return TaskBase.__call__(self, *args, **kwargs)
 
 celery.Task = ContextTask
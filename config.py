@@ -19,6 +19,14 @@ class Config:
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = 3600
 
+    # OAuth client used to refresh the stored grants; read from credentials.json when unset.
+    GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
+    GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET')
+    GOOGLE_CLIENT_SECRETS_FILE = os.environ.get('GOOGLE_CLIENT_SECRETS_FILE', 'credentials.json')
+    # Fernet key for stored refresh tokens; derived from SECRET_KEY when unset,
+    # so changing SECRET_KEY then means every user has to sign in again.
+    CREDENTIALS_KEY = os.environ.get('CREDENTIALS_KEY')
+
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
@@ -33,6 +41,17 @@ class ProductionConfig(Config):
     DEBUG = False
     # For production, DATABASE_URL should be a full URL to a production DB (e.g., Postgres)
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+    # Each process can open up to pool_size + max_overflow connections, and the
+    # total over every process must stay below Postgres's max_connections (100
+    # on a default Fly Postgres). With fly.toml that is 4 x 10 for the web
+    # workers, 10 each for the default and sentiment workers and 20 for the 'io'
+    # worker, whose threads hold a connection only between Google calls: 80.
+    # Raise max_connections before adding processes or threads.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_pre_ping': True,
+    }
     SESSION_COOKIE_SECURE = True
 
 # Create session directory if it doesn't exist
@@ -4,7 +4,7 @@ from .extensions import db, sess, csrf
 from config import DevelopmentConfig, ProductionConfig
 import os
 
-def create_app(config_class=ProductionConfig):
+def create_app(config_class=ProductionConfig, with_views=True):
     app = Flask(__name__, instance_relative_config=True)
     if os.environ.get("FLASK_ENV") == "development":
         config_class = DevelopmentConfig
@@ -13,6 +13,8 @@ def create_app(config_class=ProductionConfig):
     except OSError: pass
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
     db.init_app(app)
+    # Workers only need the database; views, sessions and CLI commands are web-only.
+    if not with_views: return app
     sess.init_app(app)
     csrf.init_app(app)
     from .auth import routes as auth_blueprint
@@ -23,5 +25,14 @@ def create_app(config_class=ProductionConfig):
     app.register_blueprint(template_manager_blueprint.templates_bp, url_prefix='/templates')
     from . import commands
     app.cli.add_command(commands.init_db_command)
+    app.cli.add_command(commands.create_tables_command)
     app.cli.add_command(commands.seed_defaults_command)
+    app.cli.add_command(commands.suppress_addresses_command)
+    app.cli.add_command(commands.resume_campaign_command)
+    from .metrics import render_metrics
+    from prometheus_client import CONTENT_TYPE_LATEST
+    @app.route('/metrics')
+    @csrf.exempt
+    def metrics():
+        return render_metrics(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
     return app
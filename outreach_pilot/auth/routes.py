@@ -2,6 +2,8 @@ import os
 from flask import Blueprint, redirect, url_for, session, request, flash, render_template
 from google_auth_oauthlib.flow import Flow
 import googleapiclient.discovery
+from outreach_pilot.token_store import store_token
+from outreach_pilot.credential_store import save_credentials
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -68,11 +70,13 @@ def oauth2callback():
         'client_secret': credentials.client_secret,
         'scopes': credentials.scopes
     }
+    store_token(session['credentials'], credentials.token, credentials.expiry)
 
     try:
         service = googleapiclient.discovery.build('oauth2', 'v2', credentials=credentials)
         user_info = service.userinfo().get().execute()
         session['user_email'] = user_info['email']
+        save_credentials(session['user_email'], session['credentials'])
     except Exception as e:
         flash(f"Error getting user info: {e}", "danger")
         # CORRECTED: Redirect to the correct campaigns.index
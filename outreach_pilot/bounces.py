@@ -0,0 +1,30 @@
+import re
+
+# Header-only classification of inbound thread messages, run on metadata
+# fetches before any body is downloaded. Hard bounces end the contact and
+# suppress the address; delay notices and auto-replies (out of office,
+# vacation responders) are skipped and the contact keeps waiting for a reply.
+CLASSIFY_HEADERS = ['From', 'Subject', 'Content-Type', 'Auto-Submitted', 'X-Autoreply', 'X-Autorespond', 'Precedence', 'X-Failed-Recipients']
+BOUNCE_SEARCH = 'from:(mailer-daemon OR postmaster)'
+BOUNCE_SENDER_RE = re.compile(r'mailer-daemon|postmaster@|mail delivery (?:subsystem|system)', re.I)
+# Delay notices are recognised by the notice's own subject, which comes before
+# any echo of the original subject, never by words that subject might contain.
+DELAY_SUBJECT_RE = re.compile(r'^\s*(?:Delivery Status Notification \(Delay\)|Delayed Mail|Delivery Delayed|Mail Delivery Delayed|Warning: could not send)', re.I)
+AUTO_REPLY_PRECEDENCE = ('auto_reply', 'bulk', 'junk')
+
+def message_headers(message):
+    return {header['name'].lower(): header['value'] for header in message.get('payload', {}).get('headers', [])}
+
+def classify_message(message):
+    """Return 'bounce', 'delayed', 'auto_reply' or 'reply' for a message fetched with CLASSIFY_HEADERS."""
+    headers = message_headers(message); content_type = headers.get('content-type', '').lower()
+    delivery_report = 'multipart/report' in content_type and 'delivery-status' in content_type
+    if delivery_report or 'x-failed-recipients' in headers or BOUNCE_SENDER_RE.search(headers.get('from', '')):
+        if 'x-failed-recipients' not in headers and DELAY_SUBJECT_RE.match(headers.get('subject', '')): return 'delayed'
+        return 'bounce'
+    if headers.get('auto-submitted', 'no').lower() != 'no' or 'x-autoreply' in headers or 'x-autorespond' in headers: return 'auto_reply'
+    if headers.get('precedence', '').lower() in AUTO_REPLY_PRECEDENCE: return 'auto_reply'
+    return 'reply'
+
+def failed_recipients(message):
+    return [address.strip() for address in message_headers(message).get('x-failed-recipients', '').split(',') if address.strip()]
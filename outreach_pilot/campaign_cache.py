@@ -0,0 +1,30 @@
+import os
+import json
+from functools import lru_cache
+from .extensions import db
+from .models import Campaign
+from .credential_store import load_credentials
+from .renderer import compile_template
+
+# Campaign settings do not change once a campaign has been dispatched, so each
+# worker process loads them from the database once and tasks only need to carry
+# campaign and contact IDs.
+CAMPAIGN_CACHE_SIZE = int(os.environ.get('CAMPAIGN_CACHE_SIZE', 128))
+
+@lru_cache(maxsize=CAMPAIGN_CACHE_SIZE)
+def get_campaign_settings(campaign_id):
+    campaign = db.session.get(Campaign, campaign_id)
+    if campaign is None: raise LookupError(f"Campaign {campaign_id} does not exist.")
+    return {
+        'id': campaign.id,
+        'user_email': campaign.user_email,
+        'credentials': load_credentials(campaign.user_email),
+        'sender_email': campaign.sender_email,
+        'g_sheet_id': campaign.g_sheet_id,
+        'column_mappings': json.loads(campaign.column_mappings),
+        'num_followups': campaign.num_followups,
+        'total_wait_seconds': campaign.total_wait_seconds,
+        'check_frequency_seconds': campaign.check_frequency_seconds,
+        'use_random_followups': campaign.use_random_followups,
+        'templates': [{'subject': compile_template(t.subject), 'body': compile_template(t.body)} for t in campaign.templates],
+    }
@@ -1,23 +1,32 @@
-from flask import (Blueprint, session, render_template, flash, redirect, url_for, request, jsonify)
-from google.oauth2.credentials import Credentials
-import googleapiclient.discovery
-import gspread
-from outreach_pilot.tasks import start_outreach_campaign
-from outreach_pilot.models import EmailTemplate
+from flask import (Blueprint, session, render_template, flash, redirect, url_for, request, jsonify, Response, stream_with_context)
+from gspread.utils import absolute_range_name
+from outreach_pilot.tasks import start_outreach_campaign, resume_campaign, refresh_drive_listing, calculate_seconds
+from outreach_pilot.google_clients import get_credentials, get_gspread_client
+from outreach_pilot.credential_store import save_credentials, has_credentials
+from outreach_pilot.drive_cache import get_listing, is_stale, claim_refresh, is_refreshing, search_listing
+from outreach_pilot.models import Campaign, CampaignTemplate
+from outreach_pilot.template_cache import get_templates
+from outreach_pilot.renderer import missing_fields
+from outreach_pilot.progress import get_progress, claim_stream_slot, release_stream_slot, PROGRESS_STREAM_INTERVAL, PROGRESS_STREAM_SECONDS, PROGRESS_POLL_SECONDS
+from outreach_pilot.extensions import db
 from outreach_pilot.auth.utils import login_required
 import json
+import time
 
 campaigns_bp = Blueprint('campaigns', __name__)
 
+NAME_KEYWORDS = ['name', 'full name', 'contact']
+EMAIL_KEYWORDS = ['email', 'e-mail', 'email address', 'mail']
+
 def get_user_credentials():
     if 'credentials' not in session: return None
     try:
-        creds_data = session['credentials']
-        creds = Credentials(**creds_data)
+        # Tokens are refreshed through the shared token store, so the web app and the workers never refresh the same grant twice.
+        creds = get_credentials(session['credentials'])
         if creds.expired and creds.refresh_token:
             import google.auth.transport.requests
             creds.refresh(google.auth.transport.requests.Request())
-            session['credentials'] = {'token': creds.token, 'refresh_token': creds.refresh_token, 'token_uri': creds.token_uri, 'client_id': creds.client_id, 'client_secret': creds.client_secret, 'scopes': creds.scopes}
+        if creds.token != session['credentials'].get('token'): session['credentials'] = {**session['credentials'], 'token': creds.token}
         return creds
     except Exception as e:
         print(f"get_user_credentials error: {e}"); session.clear(); return None
@@ -31,18 +40,43 @@ def find_best_match(headers, keywords):
             if keyword in lower_h: return original_h
     return None
 
+def describe_headers(headers):
+    return {"headers": headers, "suggested_name": find_best_match(headers, NAME_KEYWORDS), "suggested_email": find_best_match(headers, EMAIL_KEYWORDS)}
+
+def fetch_sheet_headers(workbook, titles):
+    """Read the header row of every worksheet with a single values.batchGet call."""
+    if not titles: return {}
+    response = workbook.values_batch_get([absolute_range_name(title, '1:1') for title in titles])
+    return {title: describe_headers((value_range.get('values') or [[]])[0]) for title, value_range in zip(titles, response.get('valueRanges', []))}
+
+def request_drive_refresh(user_email):
+    if not claim_refresh(user_email): return
+    try: refresh_drive_listing.delay(user_email, session['credentials'])
+    except Exception as e:
+        print(f"Could not queue Drive listing refresh, listing inline: {e}"); refresh_drive_listing(user_email, session['credentials'])
+
 @campaigns_bp.route('/')
 @login_required
 def index():
     creds = get_user_credentials()
     if not creds: return redirect(url_for('auth.login'))
-    try:
-        drive_service = googleapiclient.discovery.build('drive', 'v3', credentials=creds)
-        results = drive_service.files().list(q="mimeType='application/vnd.google-apps.spreadsheet'", pageSize=100, fields="files(id, name)").execute()
-        return render_template('start_campaign.html', user_email=session.get('user_email'), sheets=results.get('files', []))
-    except Exception as e:
-        flash(f"Error fetching Google Sheets: {e}", "danger")
-        return render_template('start_campaign.html', user_email=session.get('user_email'), sheets=[])
+    if is_stale(get_listing(session.get('user_email'))): request_drive_refresh(session.get('user_email'))
+    return render_template('start_campaign.html', user_email=session.get('user_email'))
+
+@campaigns_bp.route('/sheets')
+@login_required
+def list_sheets():
+    user_email = session.get('user_email'); listing = get_listing(user_email)
+    if request.args.get('refresh') or is_stale(listing):
+        if not get_user_credentials(): return jsonify({"error": "Not authenticated"}), 401
+        request_drive_refresh(user_email); listing = get_listing(user_email)
+    status = dict(ready=listing is not None, refreshing=is_refreshing(user_email), fetched_at=listing['fetched_at'] if listing else None)
+    # The picker polls with status=1 while a refresh runs and only reloads the list once it is over.
+    if request.args.get('status'): return jsonify(status)
+    page = max(1, request.args.get('page', 1, type=int)); per_page = min(100, max(1, request.args.get('per_page', 50, type=int)))
+    result = search_listing(listing['files'] if listing else [], request.args.get('q', '').strip(), page, per_page)
+    result.update(status)
+    return jsonify(result)
 
 @campaigns_bp.route('/configure', methods=['POST'])
 @login_required
@@ -53,12 +87,14 @@ def configure_campaign():
         return redirect(url_for('campaigns.index'))
     creds = get_user_credentials()
     if not creds: return redirect(url_for('auth.login'))
-    gc = gspread.authorize(creds)
+    gc = get_gspread_client(session['credentials'])
     try:
-        workbook = gc.open_by_key(sheet_id)
-        session['g_sheet_id'] = sheet_id; session['g_sheet_name'] = workbook.title
-        serializable_templates = [{'id': t.id, 'subject': t.subject, 'body': t.body} for t in EmailTemplate.query.all()]
-        return render_template('configure_campaign.html', sheets=[s.title for s in workbook.worksheets()], g_sheet_name=workbook.title, templates=serializable_templates)
+        workbook = gc.open_by_key(sheet_id); titles = [s.title for s in workbook.worksheets()]
+        # Header rows (and column suggestions) for every tab are cached in the session, so the form never asks for them again.
+        sheet_headers = fetch_sheet_headers(workbook, titles)
+        session['g_sheet_id'] = sheet_id; session['g_sheet_name'] = workbook.title; session['sheet_headers'] = {'sheet_id': sheet_id, 'worksheets': sheet_headers}
+        serializable_templates = [{'id': t['id'], 'subject': t['subject'], 'body': t['body']} for t in get_templates()]
+        return render_template('configure_campaign.html', sheets=titles, sheet_headers=sheet_headers, g_sheet_name=workbook.title, templates=serializable_templates)
     except Exception as e:
         flash(f"Error opening sheet: {e}", "danger")
         return redirect(url_for('campaigns.index'))
@@ -69,12 +105,15 @@ def get_sheet_headers():
     sheet_id = session.get('g_sheet_id')
     worksheet_name = request.json.get('worksheet_name')
     if not sheet_id or not worksheet_name: return jsonify({"error": "Missing sheet ID or worksheet name"}), 400
+    cached = session.get('sheet_headers') or {}
+    if cached.get('sheet_id') == sheet_id and worksheet_name in cached.get('worksheets', {}): return jsonify(cached['worksheets'][worksheet_name])
     creds = get_user_credentials()
     if not creds: return jsonify({"error": "Not authenticated"}), 401
     try:
-        gc = gspread.authorize(creds)
-        headers = gc.open_by_key(sheet_id).worksheet(worksheet_name).row_values(1)
-        return jsonify({"headers": headers, "suggested_name": find_best_match(headers, ['name', 'full name', 'contact']), "suggested_email": find_best_match(headers, ['email', 'e-mail', 'email address', 'mail'])})
+        gc = get_gspread_client(session['credentials'])
+        description = describe_headers(gc.open_by_key(sheet_id).worksheet(worksheet_name).row_values(1))
+        if cached.get('sheet_id') == sheet_id: cached['worksheets'][worksheet_name] = description; session['sheet_headers'] = cached
+        return jsonify(description)
     except Exception as e: return jsonify({"error": str(e)}), 500
 
 @campaigns_bp.route('/start', methods=['POST'])
@@ -106,5 +145,64 @@ def start_campaign():
                 flash(f"Error: Missing subject/body for follow-up #{i}.", "danger"); return redirect(request.referrer or url_for('campaigns.index'))
             campaign_templates.append({'subject': subject, 'body': body})
     use_random_followups = 'use_random_followups' in request.form
-    start_outreach_campaign.delay(session['credentials'], g_sheet_id, column_mappings, num_followups, total_wait_time_value, total_wait_time_unit, check_frequency_value, check_frequency_unit, campaign_templates, use_random_followups)
-    return render_template('campaign_started.html', sheet_name=g_sheet_name)
+    # Check the placeholders against the header rows cached when the sheet was configured.
+    cached = session.get('sheet_headers') or {}
+    if cached.get('sheet_id') == g_sheet_id:
+        template_texts = [text for t in campaign_templates for text in (t['subject'], t['body'])]
+        for sheet_name in contacts_sheet_names:
+            description = cached.get('worksheets', {}).get(sheet_name)
+            unknown_fields = missing_fields(template_texts, [header.strip() for header in description['headers']]) if description else []
+            if unknown_fields:
+                flash(f"Error: The templates use {', '.join('{' + field + '}' for field in unknown_fields)}, which no column in '{sheet_name}' fills.", "danger"); return redirect(request.referrer or url_for('campaigns.index'))
+    campaign = Campaign(user_email=session.get('user_email'), g_sheet_id=g_sheet_id, g_sheet_name=g_sheet_name, column_mappings=json.dumps(column_mappings), num_followups=num_followups, total_wait_seconds=calculate_seconds(total_wait_time_value, total_wait_time_unit), check_frequency_seconds=calculate_seconds(check_frequency_value, check_frequency_unit), use_random_followups=use_random_followups)
+    campaign.templates = [CampaignTemplate(position=i, subject=t['subject'], body=t['body']) for i, t in enumerate(campaign_templates)]
+    try:
+        if not has_credentials(campaign.user_email): save_credentials(campaign.user_email, session['credentials'])
+        db.session.add(campaign); db.session.commit()
+    except Exception as e:
+        db.session.rollback(); flash(f"Error saving campaign: {e}", "danger"); return redirect(request.referrer or url_for('campaigns.index'))
+    start_outreach_campaign.delay(campaign.id)
+    return render_template('campaign_started.html', sheet_name=g_sheet_name, campaign_id=campaign.id, poll_seconds=PROGRESS_POLL_SECONDS)
+
+def owns_campaign(campaign_id):
+    campaign = db.session.get(Campaign, campaign_id)
+    return campaign is not None and campaign.user_email == session.get('user_email')
+
+@campaigns_bp.route('/campaign/<int:campaign_id>/resume', methods=['POST'])
+@login_required
+def resume(campaign_id):
+    if not owns_campaign(campaign_id): return jsonify({"error": "Campaign not found."}), 404
+    task = resume_campaign.delay(campaign_id)
+    return jsonify({"campaign_id": campaign_id, "task_id": task.id}), 202
+
+# Progress is read from the Redis counters the tasks keep, never from the sheet.
+@campaigns_bp.route('/campaign/<int:campaign_id>/progress')
+@login_required
+def progress(campaign_id):
+    if not owns_campaign(campaign_id): return jsonify({"error": "Campaign not found."}), 404
+    return jsonify(get_progress(campaign_id))
+
+@campaigns_bp.route('/campaign/<int:campaign_id>/progress/stream')
+@login_required
+def progress_stream(campaign_id):
+    # Sends the counters whenever they change and closes once the campaign is
+    # done or after PROGRESS_STREAM_SECONDS; the browser's EventSource then
+    # reconnects, so a long campaign does not hold a web thread indefinitely.
+    # When this process already serves its share of streams the answer is 204,
+    # which stops EventSource from reconnecting and makes the page poll instead.
+    # The database connection is given back before streaming starts.
+    if not owns_campaign(campaign_id): return jsonify({"error": "Campaign not found."}), 404
+    if not claim_stream_slot(): return '', 204
+    db.session.remove()
+    def events():
+        yield f"retry: {int(PROGRESS_STREAM_INTERVAL * 1000)}\n\n"
+        last = None; deadline = time.monotonic() + PROGRESS_STREAM_SECONDS; idle = 0
+        while time.monotonic() < deadline:
+            current = get_progress(campaign_id)
+            if current != last: yield f"data: {json.dumps(current)}\n\n"; last = current; idle = 0
+            elif idle * PROGRESS_STREAM_INTERVAL >= 15: yield ": keep-alive\n\n"; idle = 0
+            if current['done']: yield "event: done\ndata: {}\n\n"; return
+            time.sleep(PROGRESS_STREAM_INTERVAL); idle += 1
+    response = Response(stream_with_context(events()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(release_stream_slot)
+    return response
@@ -3,6 +3,8 @@ import textwrap
 from flask.cli import with_appcontext
 from .extensions import db
 from .models import EmailTemplate
+from .ledger import suppress_addresses
+from .template_cache import bump_template_version
 
 @click.command(name='init-db')
 @with_appcontext
@@ -12,6 +14,33 @@ def init_db_command():
     db.create_all()
     click.echo('Initialized the database.')
 
+@click.command(name='create-tables')
+@with_appcontext
+def create_tables_command():
+    """Create any missing tables without touching existing data."""
+    db.create_all()
+    click.echo('Created missing tables.')
+
+@click.command(name='suppress-addresses')
+@click.argument('sender_email')
+@click.argument('emails', nargs=-1, required=True)
+@click.option('--status', default='SUPPRESSED', type=click.Choice(['SUPPRESSED', 'BOUNCED', 'UNSUBSCRIBED']))
+@with_appcontext
+def suppress_addresses_command(sender_email, emails, status):
+    """Never email the given addresses from SENDER_EMAIL again."""
+    suppress_addresses(sender_email, emails, status)
+    click.echo(f'Suppressed {len(emails)} addresses for {sender_email}.')
+
+@click.command(name='resume-campaign')
+@click.argument('campaign_id', type=int)
+@click.option('--requeue-pending', is_flag=True, help='Also requeue every PENDING contact; use only if the Redis queues were lost.')
+@with_appcontext
+def resume_campaign_command(campaign_id, requeue_pending):
+    """Requeue CAMPAIGN_ID's unfinished ingestion, interrupted sends and reply checks."""
+    from .tasks import resume_campaign
+    summary = resume_campaign(campaign_id, requeue_pending)
+    click.echo(', '.join(f'{key}: {value}' for key, value in summary.items()) if summary else f'Campaign {campaign_id} not found.')
+
 @click.command(name='seed-defaults')
 @with_appcontext
 def seed_defaults_command():
@@ -197,5 +226,5 @@ def seed_defaults_command():
 
     for t in DEFAULT_TEMPLATES:
         db.session.add(EmailTemplate(subject=t['subject'], body=t['body'], is_default=True))
-    db.session.commit()
+    bump_template_version(); db.session.commit()
     click.echo(f'Successfully seeded {len(DEFAULT_TEMPLATES)} new default templates.')
@@ -0,0 +1,50 @@
+import json
+import base64
+import hashlib
+from cryptography.fernet import Fernet
+from flask import current_app
+from .extensions import db
+from .models import UserCredential
+
+# Each user's Google grant is kept once, as a refresh token encrypted with
+# CREDENTIALS_KEY (or a key derived from SECRET_KEY), rather than as a full
+# credentials dict on every campaign. The OAuth client ID and secret come from
+# the app config, and access tokens live in the shared token store, so the
+# dict the Google clients need is rebuilt from those three when a task runs.
+
+def cipher():
+    key = current_app.config.get('CREDENTIALS_KEY') or base64.urlsafe_b64encode(hashlib.sha256(current_app.config['SECRET_KEY'].encode()).digest())
+    return Fernet(key)
+
+def client_secrets():
+    """Return the OAuth client's (client_id, client_secret), from the config or else credentials.json."""
+    config = current_app.config
+    if config.get('GOOGLE_CLIENT_ID'): return config['GOOGLE_CLIENT_ID'], config['GOOGLE_CLIENT_SECRET']
+    with open(config['GOOGLE_CLIENT_SECRETS_FILE']) as f: secrets = json.load(f)
+    client = secrets.get('web') or secrets.get('installed')
+    return client['client_id'], client['client_secret']
+
+def save_credentials(user_email, credentials_dict):
+    """Keep the user's refresh token, replacing any earlier one; nothing else in the dict is stored."""
+    if not credentials_dict.get('refresh_token'): return
+    row = db.session.get(UserCredential, user_email) or UserCredential(user_email=user_email)
+    row.refresh_token = cipher().encrypt(credentials_dict['refresh_token'].encode()).decode()
+    row.token_uri = credentials_dict.get('token_uri'); row.scopes = json.dumps(credentials_dict.get('scopes') or [])
+    db.session.add(row); db.session.commit()
+
+def has_credentials(user_email):
+    return db.session.get(UserCredential, user_email) is not None
+
+def load_credentials(user_email):
+    """Rebuild the credentials dict for the Google clients; the access token is picked up from the token store."""
+    row = db.session.get(UserCredential, user_email)
+    if row is None: raise LookupError(f"No Google credentials are stored for {user_email}.")
+    client_id, client_secret = client_secrets()
+    return {
+        'token': None,
+        'refresh_token': cipher().decrypt(row.refresh_token.encode()).decode(),
+        'token_uri': row.token_uri,
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'scopes': json.loads(row.scopes or '[]'),
+    }
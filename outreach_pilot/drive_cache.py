@@ -0,0 +1,55 @@
+import os
+import json
+import time
+from .extensions import redis_client
+from .metrics import observe_call
+
+# Per-user cache of the spreadsheets visible in Google Drive. The campaign index
+# page renders immediately and loads the list from a JSON endpoint; listing all
+# of a user's spreadsheets (which can take many Drive pages) happens in the
+# refresh_drive_listing task whenever the cache is missing, older than
+# DRIVE_CACHE_TTL or the user asks for a refresh.
+DRIVE_CACHE_TTL = int(os.environ.get('DRIVE_CACHE_TTL', 600))
+DRIVE_PAGE_SIZE = 1000
+SPREADSHEET_QUERY = "mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
+
+def listing_key(user_email):
+    return f"drive_sheets:{user_email}"
+
+def list_all_spreadsheets(drive_service):
+    files = []; page_token = None
+    while True:
+        with observe_call('drive', 'files_list'): response = drive_service.files().list(q=SPREADSHEET_QUERY, pageSize=DRIVE_PAGE_SIZE, fields="nextPageToken, files(id, name)", orderBy="modifiedTime desc", pageToken=page_token).execute()
+        files.extend({'id': f['id'], 'name': f['name']} for f in response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token: return files
+
+def store_listing(user_email, files):
+    # Kept well past the TTL so a stale list can still be served while it refreshes.
+    redis_client.set(listing_key(user_email), json.dumps({'fetched_at': time.time(), 'files': files}), ex=DRIVE_CACHE_TTL * 24)
+
+def get_listing(user_email):
+    """Return the cached {'fetched_at', 'files'} for a user, or None."""
+    raw = redis_client.get(listing_key(user_email))
+    return json.loads(raw) if raw else None
+
+def is_stale(listing):
+    return listing is None or time.time() - listing['fetched_at'] > DRIVE_CACHE_TTL
+
+def claim_refresh(user_email):
+    """Return True if the caller should start a refresh (one at a time per user)."""
+    return bool(redis_client.set(f"{listing_key(user_email)}:refreshing", 1, nx=True, ex=300))
+
+def release_refresh(user_email, retry_after=0):
+    # After a failed refresh the claim is kept for `retry_after` seconds so open pages do not retry in a loop.
+    if retry_after: redis_client.expire(f"{listing_key(user_email)}:refreshing", retry_after)
+    else: redis_client.delete(f"{listing_key(user_email)}:refreshing")
+
+def is_refreshing(user_email):
+    return bool(redis_client.exists(f"{listing_key(user_email)}:refreshing"))
+
+def search_listing(files, query='', page=1, per_page=50):
+    terms = query.lower().split()
+    matches = [f for f in files if all(term in f['name'].lower() for term in terms)] if terms else files
+    start = (page - 1) * per_page
+    return {'files': matches[start:start + per_page], 'total': len(matches), 'page': page, 'per_page': per_page, 'has_more': start + per_page < len(matches)}
@@ -1,3 +1,5 @@
+import os
+import redis
 from flask_sqlalchemy import SQLAlchemy
 from flask_session import Session
 from flask_wtf.csrf import CSRFProtect
@@ -5,4 +7,4 @@ from flask_wtf.csrf import CSRFProtect
 db = SQLAlchemy()
 sess = Session()
 csrf = CSRFProtect()
-
+redis_client = redis.Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True)
@@ -0,0 +1,81 @@
+import os
+import json
+from .extensions import redis_client
+
+# Fair-share scheduling in front of the Celery 'io' queue. Work is parked in a
+# Redis list per (kind, tenant), where the tenant is the campaign owner's
+# user_email, and pump_fair_queues moves it onto the broker in weighted
+# round-robin: each round visits the kinds in priority order and gives every
+# tenant of a kind up to that kind's weight. The broker backlog is capped at
+# FAIR_MAX_BACKLOG, so a big campaign's sends wait here and reply checks and
+# sheet writes from everyone else go ahead of them.
+FAIR_KINDS = ('reply_check', 'sheet_write', 'initial_send')
+FAIR_WEIGHTS = {kind: int(os.environ.get(f"FAIR_WEIGHT_{kind.upper()}", weight)) for kind, weight in (('reply_check', 8), ('sheet_write', 8), ('initial_send', 1))}
+FAIR_MAX_BACKLOG = int(os.environ.get('FAIR_MAX_BACKLOG', 200))
+FAIR_PUMP_INTERVAL = int(os.environ.get('FAIR_PUMP_INTERVAL', 2))
+
+def queue_key(kind, tenant):
+    return f"fair:{kind}:{tenant}"
+
+def tenants_key(kind):
+    return f"fair:{kind}:tenants"
+
+def enqueue(kind, tenant, items):
+    """Park (task name, args, kwargs, headers) tuples for a tenant until the pump publishes them."""
+    if not items: return
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.rpush(queue_key(kind, tenant), *[json.dumps({'task': task, 'args': args, 'kwargs': kwargs or {}, 'headers': headers}) for task, args, kwargs, headers in items])
+    pipe.sadd(tenants_key(kind), tenant)
+    pipe.execute()
+
+# Pop up to ARGV[2] items and drop the tenant from the kind's set once its
+# list is empty, atomically so a concurrent enqueue cannot be stranded.
+POP_SCRIPT = redis_client.register_script("""
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+if #items > 0 then redis.call('LTRIM', KEYS[1], #items, -1) end
+if redis.call('LLEN', KEYS[1]) == 0 then redis.call('SREM', KEYS[2], ARGV[1]) end
+return items
+""")
+
+def pop(kind, tenant, count):
+    return [json.loads(item) for item in POP_SCRIPT(keys=[queue_key(kind, tenant), tenants_key(kind)], args=[tenant, count])]
+
+def restore(kind, tenant, items):
+    """Put items that could not be published back at the head of the tenant's list."""
+    if not items: return
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.lpush(queue_key(kind, tenant), *[json.dumps(item) for item in reversed(items)])
+    pipe.sadd(tenants_key(kind), tenant)
+    pipe.execute()
+
+def rotated_tenants(kind):
+    """The kind's tenants, starting one further along on every call so no tenant is always served first."""
+    tenants = sorted(redis_client.smembers(tenants_key(kind)))
+    if not tenants: return []
+    start = redis_client.incr(f"fair:{kind}:cursor") % len(tenants)
+    return tenants[start:] + tenants[:start]
+
+def take_fair_share(budget):
+    """Pop up to `budget` items in weighted round-robin; returns [(kind, tenant, items)]."""
+    taken = []
+    while budget > 0:
+        progress = False
+        for kind in FAIR_KINDS:
+            for tenant in rotated_tenants(kind):
+                if budget <= 0: break
+                items = pop(kind, tenant, min(FAIR_WEIGHTS[kind], budget))
+                if items: taken.append((kind, tenant, items)); budget -= len(items); progress = True
+        if not progress: break
+    return taken
+
+def pending_counts():
+    """Return {kind: items waiting across all tenants}."""
+    counts = {}
+    for kind in FAIR_KINDS:
+        tenants = list(redis_client.smembers(tenants_key(kind))); pipe = redis_client.pipeline()
+        for tenant in tenants: pipe.llen(queue_key(kind, tenant))
+        counts[kind] = sum(pipe.execute()) if tenants else 0
+    return counts
+
+def pump_lock():
+    return redis_client.lock('fair:pump', timeout=60)
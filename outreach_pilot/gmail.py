@@ -0,0 +1,119 @@
+import base64
+from .metrics import observed, observe_call, record_error
+
+# Gmail accepts up to 100 calls per batch request, but recommends staying at or
+# below 50 to avoid per-user rate limiting inside the batch.
+GMAIL_BATCH_LIMIT = 100
+
+@observed('gmail', 'profile')
+def get_profile(service):
+    return service.users().getProfile(userId='me').execute()
+
+def build_raw_message(sender_email, to, subject, body):
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+    message = MIMEMultipart(); message['to'] = to; message['subject'] = subject
+    message['from'] = f"iTranscript360 <{sender_email}>"
+    message.attach(MIMEText(body, 'html'))
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+@observed('gmail', 'send')
+def send_message(service, sender_email, to, subject, body):
+    """Send one message and return its thread ID; errors are raised to the caller."""
+    raw_message = build_raw_message(sender_email, to, subject, body)
+    return service.users().messages().send(userId="me", body={'raw': raw_message}).execute().get('threadId')
+
+def send_gmail_batch(service, sender_email, messages, batch_size=50):
+    """Send many messages through the Gmail batch endpoint.
+
+    `messages` is a list of (key, to, subject, body) tuples where each key is a
+    unique string. Returns two dicts keyed by message key: thread IDs for the
+    messages that were sent and the exceptions for the ones that failed.
+    """
+    batch_size = max(1, min(batch_size, GMAIL_BATCH_LIMIT))
+    thread_ids, failures = {}, {}
+
+    def on_response(request_id, response, exception):
+        if exception is not None: failures[request_id] = exception; record_error('gmail', 'send', exception)
+        elif not response.get('threadId'): failures[request_id] = RuntimeError("No thread ID returned")
+        else: thread_ids[request_id] = response['threadId']
+
+    for start in range(0, len(messages), batch_size):
+        chunk = messages[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=on_response)
+        for key, to, subject, body in chunk:
+            raw_message = build_raw_message(sender_email, to, subject, body)
+            batch.add(service.users().messages().send(userId='me', body={'raw': raw_message}), request_id=key)
+        try:
+            with observe_call('gmail', 'send_batch'): batch.execute()
+        except Exception as e:
+            print(f"ERROR executing Gmail batch of {len(chunk)} messages: {e}")
+            for key, *_ in chunk:
+                if key not in thread_ids and key not in failures: failures[key] = e
+    return thread_ids, failures
+
+@observed('gmail', 'threads_get')
+def get_thread_message_ids(service, thread_id):
+    """Return the message IDs of a thread, oldest first, without downloading any bodies."""
+    thread = service.users().threads().get(userId='me', id=thread_id, format='minimal', fields='messages/id').execute()
+    return [message['id'] for message in thread.get('messages', [])]
+
+def get_thread_message_ids_batch(service, thread_ids, batch_size=50):
+    """Probe many threads with batched minimal gets; returns {thread_id: [message IDs]}.
+
+    Threads whose probe failed are left out and reported on stdout.
+    """
+    batch_size = max(1, min(batch_size, GMAIL_BATCH_LIMIT)); thread_ids = list(thread_ids); message_ids = {}
+
+    def on_response(request_id, response, exception):
+        if exception is not None: print(f"ERROR probing thread {request_id}: {exception}"); record_error('gmail', 'threads_get', exception)
+        else: message_ids[request_id] = [message['id'] for message in response.get('messages', [])]
+
+    for start in range(0, len(thread_ids), batch_size):
+        chunk = thread_ids[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=on_response)
+        for thread_id in chunk:
+            batch.add(service.users().threads().get(userId='me', id=thread_id, format='minimal', fields='messages/id'), request_id=thread_id)
+        try:
+            with observe_call('gmail', 'threads_get_batch'): batch.execute()
+        except Exception as e: print(f"ERROR executing Gmail batch of {len(chunk)} thread probes: {e}")
+    return message_ids
+
+@observed('gmail', 'messages_get')
+def get_message(service, message_id):
+    return service.users().messages().get(userId='me', id=message_id, format='full').execute()
+
+@observed('gmail', 'messages_metadata')
+def get_message_metadata(service, message_id, headers):
+    return service.users().messages().get(userId='me', id=message_id, format='metadata', metadataHeaders=headers, fields='id,labelIds,payload/headers').execute()
+
+@observed('gmail', 'messages_list')
+def list_message_ids(service, query):
+    """Return the IDs of every message matching a Gmail search query."""
+    message_ids = []; page_token = None
+    while True:
+        response = service.users().messages().list(userId='me', q=query, pageToken=page_token, fields='messages/id,nextPageToken').execute()
+        message_ids += [message['id'] for message in response.get('messages', [])]; page_token = response.get('nextPageToken')
+        if not page_token: return message_ids
+
+def list_history_thread_ids(service, start_history_id):
+    """Return (thread IDs with newly received messages, latest history ID).
+
+    Messages we sent ourselves are ignored. The thread set is None when
+    `start_history_id` is too old for Gmail to serve, in which case callers
+    must fall back to checking every thread they care about.
+    """
+    from googleapiclient.errors import HttpError
+    thread_ids = set(); history_id = start_history_id; page_token = None
+    while True:
+        try:
+            with observe_call('gmail', 'history_list'): response = service.users().history().list(userId='me', startHistoryId=start_history_id, historyTypes='messageAdded', pageToken=page_token).execute()
+        except HttpError as e:
+            if e.resp.status == 404: return None, get_profile(service)['historyId']
+            raise
+        for record in response.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message = added['message']
+                if 'SENT' not in message.get('labelIds', []): thread_ids.add(message['threadId'])
+        history_id = response.get('historyId', history_id); page_token = response.get('nextPageToken')
+        if not page_token: return thread_ids, history_id
@@ -0,0 +1,86 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Process-level pool of Google API clients. Building a service means loading a
+# discovery document and opening a new HTTP connection, which for small calls
+# such as a thread lookup costs more than the call itself. Entries are keyed by
+# credential identity (client ID + refresh token), share a single Credentials
+# object so one refresh serves every client, and are evicted by LRU and TTL.
+# Refreshes go through the shared token store (token_store.py). The Google
+# libraries are imported when the first client is built, not at worker start;
+# discovery documents come from the copies bundled with googleapiclient.
+#
+# httplib2 connections are not thread-safe, so each thread gets its own clients
+# (and connections) on top of the shared credentials. Under prefork and gunicorn's
+# sync workers that is one set per process; the threaded 'io' worker keeps one
+# set per pool thread and reuses it across tasks.
+CLIENT_POOL_SIZE = int(os.environ.get('GOOGLE_CLIENT_POOL_SIZE', 32))
+CLIENT_POOL_TTL = int(os.environ.get('GOOGLE_CLIENT_POOL_TTL', 1800))
+HTTP_TIMEOUT = int(os.environ.get('GOOGLE_HTTP_TIMEOUT', 60))
+
+def build_service(api, version, creds):
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return build(api, version, http=http, cache_discovery=False, static_discovery=True)
+
+class ClientPool:
+    def __init__(self, max_size=CLIENT_POOL_SIZE, ttl=CLIENT_POOL_TTL):
+        self.max_size = max_size; self.ttl = ttl
+        self._entries = OrderedDict(); self._lock = threading.RLock()
+
+    def _entry(self, credentials_dict):
+        from .token_store import credential_identity, shared_credentials
+        identity = credential_identity(credentials_dict); now = time.monotonic()
+        entry = self._entries.get(identity)
+        if entry is not None:
+            expired = now - entry['created'] > self.ttl
+            # A token the pool has never seen means it was refreshed elsewhere
+            # (web request, another worker); rebuild on top of the new token.
+            refreshed_elsewhere = credentials_dict.get('token') not in (entry['token'], entry['creds'].token)
+            if expired or refreshed_elsewhere:
+                del self._entries[identity]; entry = None
+        if entry is None:
+            entry = {'creds': shared_credentials(credentials_dict), 'token': credentials_dict.get('token'), 'created': now, 'clients': {}}
+            self._entries[identity] = entry
+            while len(self._entries) > self.max_size: self._entries.popitem(last=False)
+        self._entries.move_to_end(identity)
+        return entry
+
+    def get(self, credentials_dict, kind, factory):
+        key = (kind, threading.get_ident())
+        with self._lock:
+            entry = self._entry(credentials_dict)
+            if key not in entry['clients']: entry['clients'][key] = factory(entry['creds'])
+            return entry['clients'][key]
+
+    def credentials(self, credentials_dict):
+        with self._lock: return self._entry(credentials_dict)['creds']
+
+    def invalidate(self, credentials_dict):
+        from .token_store import credential_identity
+        with self._lock: self._entries.pop(credential_identity(credentials_dict), None)
+
+    def clear(self):
+        with self._lock: self._entries.clear()
+
+client_pool = ClientPool()
+
+def get_credentials(credentials_dict):
+    return client_pool.credentials(credentials_dict)
+
+def get_gmail_service(credentials_dict):
+    return client_pool.get(credentials_dict, 'gmail', lambda creds: build_service('gmail', 'v1', creds))
+
+def get_drive_service(credentials_dict):
+    return client_pool.get(credentials_dict, 'drive', lambda creds: build_service('drive', 'v3', creds))
+
+def get_gspread_client(credentials_dict):
+    import gspread
+    return client_pool.get(credentials_dict, 'gspread', gspread.authorize)
+
+def invalidate_clients(credentials_dict):
+    client_pool.invalidate(credentials_dict)
@@ -0,0 +1,83 @@
+from .extensions import db, redis_client
+from .models import ContactLedger
+from .sheets import normalize_email
+
+# Every address a sender mailbox has emailed, or must never email, is recorded
+# in the contact_ledger table. Redis keeps the same addresses in one set per
+# sender so ingestion can claim a whole chunk of rows with pipelined SADDs:
+# SADD returns 1 only for an address nobody has claimed yet, which makes the
+# check and the claim a single atomic O(1) step even across concurrent
+# campaigns. Suppressed addresses also go into a second set so they can be told
+# apart from ones that were simply contacted before.
+LOAD_CHUNK_SIZE = 5000
+SUPPRESSED_STATUSES = ('SUPPRESSED', 'BOUNCED', 'UNSUBSCRIBED')
+
+def ledger_key(sender_email):
+    return f"ledger:{normalize_email(sender_email)}"
+
+def ensure_ledger_cache(sender_email):
+    """Load the sender's ledger into Redis the first time it is needed (or after Redis lost it)."""
+    key = ledger_key(sender_email)
+    if redis_client.exists(f"{key}:loaded"): return
+    query = db.session.query(ContactLedger.email, ContactLedger.status).filter(ContactLedger.sender_email == normalize_email(sender_email))
+    pipe = redis_client.pipeline(transaction=False); pending = 0
+    for email, status in query.yield_per(LOAD_CHUNK_SIZE):
+        pipe.sadd(key, email)
+        if status in SUPPRESSED_STATUSES: pipe.sadd(f"{key}:suppressed", email)
+        pending += 1
+        if pending >= LOAD_CHUNK_SIZE: pipe.execute(); pending = 0
+    pipe.set(f"{key}:loaded", 1); pipe.execute()
+
+def insert_ledger_rows(rows, update_status=False):
+    """Insert ledger rows, skipping (or updating the status of) addresses already recorded."""
+    if not rows: return
+    if db.engine.dialect.name == 'postgresql': from sqlalchemy.dialects.postgresql import insert
+    elif db.engine.dialect.name == 'sqlite': from sqlalchemy.dialects.sqlite import insert
+    else: insert = None
+    if insert is None:
+        existing = {email for (email,) in db.session.query(ContactLedger.email).filter(ContactLedger.sender_email == rows[0]['sender_email'], ContactLedger.email.in_([row['email'] for row in rows]))}
+        db.session.add_all([ContactLedger(**row) for row in rows if row['email'] not in existing])
+    else:
+        statement = insert(ContactLedger).values(rows)
+        if update_status: statement = statement.on_conflict_do_update(index_elements=['sender_email', 'email'], set_={'status': statement.excluded.status})
+        else: statement = statement.on_conflict_do_nothing(index_elements=['sender_email', 'email'])
+        db.session.execute(statement)
+    db.session.commit()
+
+def claim_addresses(sender_email, campaign_id, emails):
+    """Claim addresses for a campaign; returns the normalized addresses that were free to contact."""
+    ensure_ledger_cache(sender_email); key = ledger_key(sender_email)
+    candidates = list(dict.fromkeys(normalize_email(email) for email in emails if email))
+    pipe = redis_client.pipeline(transaction=False)
+    for email in candidates: pipe.sadd(key, email)
+    claimed = [email for email, added in zip(candidates, pipe.execute()) if added]
+    insert_ledger_rows([{'sender_email': normalize_email(sender_email), 'email': email, 'status': 'CONTACTED', 'campaign_id': campaign_id} for email in claimed])
+    return set(claimed)
+
+def addresses_claimed_by(sender_email, campaign_id, emails):
+    """Return the subset of `emails` this campaign already holds in the ledger."""
+    emails = list(dict.fromkeys(normalize_email(email) for email in emails if email))
+    if not emails: return set()
+    return {email for (email,) in db.session.query(ContactLedger.email).filter(ContactLedger.sender_email == normalize_email(sender_email), ContactLedger.campaign_id == campaign_id, ContactLedger.email.in_(emails))}
+
+def release_addresses(sender_email, emails):
+    """Give back addresses that were claimed but never actually emailed."""
+    emails = [normalize_email(email) for email in emails]
+    if not emails: return
+    ContactLedger.query.filter(ContactLedger.sender_email == normalize_email(sender_email), ContactLedger.email.in_(emails), ContactLedger.status == 'CONTACTED').delete(synchronize_session=False)
+    db.session.commit()
+    redis_client.srem(ledger_key(sender_email), *emails)
+
+def suppress_addresses(sender_email, emails, status='SUPPRESSED'):
+    """Block addresses from every future campaign of this sender."""
+    emails = list(dict.fromkeys(normalize_email(email) for email in emails if email))
+    if not emails: return
+    ensure_ledger_cache(sender_email); key = ledger_key(sender_email)
+    insert_ledger_rows([{'sender_email': normalize_email(sender_email), 'email': email, 'status': status} for email in emails], update_status=True)
+    pipe = redis_client.pipeline(transaction=False); pipe.sadd(key, *emails); pipe.sadd(f"{key}:suppressed", *emails); pipe.execute()
+
+def suppressed_addresses(sender_email, emails):
+    """Return the subset of `emails` that is suppressed, with one SMISMEMBER call."""
+    ensure_ledger_cache(sender_email); emails = [normalize_email(email) for email in emails]
+    if not emails: return set()
+    return {email for email, member in zip(emails, redis_client.smismember(f"{ledger_key(sender_email)}:suppressed", emails)) if member}
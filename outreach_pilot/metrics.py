@@ -0,0 +1,112 @@
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from contextlib import contextmanager
+from celery.signals import task_prerun, task_postrun, task_failure, worker_ready
+from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest, start_http_server, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from .extensions import redis_client
+from .rate_limit import is_quota_error
+
+# Prometheus metrics for the web app and the Celery workers. Every Google call
+# goes through observe_call (or the observed decorator), every task is timed
+# through Celery signals, and queue depths are read from Redis when scraped.
+# The web app serves them at /metrics; a worker serves them on
+# WORKER_METRICS_PORT. With several processes per machine (gunicorn workers,
+# prefork children) set PROMETHEUS_MULTIPROC_DIR so their values are merged.
+# Calls per contact is external_calls_total over contacts_total{event="sent"}.
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 9100))
+BROKER_QUEUES = ('celery', 'io', 'sentiment')
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600)
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'): os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+EXTERNAL_CALL_SECONDS = Histogram('outreach_external_call_seconds', 'Latency of calls to Google APIs.', ['api', 'operation'], buckets=LATENCY_BUCKETS)
+EXTERNAL_CALLS = Counter('outreach_external_calls', 'Calls made to Google APIs.', ['api', 'operation'])
+EXTERNAL_CALL_ERRORS = Counter('outreach_external_call_errors', 'Failed Google API calls, by kind (quota or error).', ['api', 'operation', 'kind'])
+TASK_SECONDS = Histogram('outreach_task_seconds', 'Run time of Celery tasks.', ['task'], buckets=LATENCY_BUCKETS)
+TASK_FAILURES = Counter('outreach_task_failures', 'Celery tasks that raised.', ['task'])
+TASK_LAG_SECONDS = Histogram('outreach_task_lag_seconds', 'Delay between the time a task was scheduled for and the time it started.', ['task'], buckets=LAG_BUCKETS)
+CONTACTS = Counter('outreach_contacts', 'Contact lifecycle events.', ['event'])
+
+def record_error(api, operation, error):
+    EXTERNAL_CALL_ERRORS.labels(api, operation, 'quota' if is_quota_error(error) else 'error').inc()
+
+@contextmanager
+def observe_call(api, operation):
+    EXTERNAL_CALLS.labels(api, operation).inc(); started = time.perf_counter()
+    try: yield
+    except Exception as e: record_error(api, operation, e); raise
+    finally: EXTERNAL_CALL_SECONDS.labels(api, operation).observe(time.perf_counter() - started)
+
+def observed(api, operation):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with observe_call(api, operation): return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_contacts(event, count=1):
+    if count: CONTACTS.labels(event).inc(count)
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)): return value
+    moment = datetime.fromisoformat(value)
+    return (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).timestamp()
+
+# Tasks published by dispatch_due_actions carry their due time in a
+# scheduled_at header; tasks published with a countdown have an ETA.
+_task_started = {}
+
+@task_prerun.connect
+def on_task_prerun(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    scheduled_at = getattr(task.request, 'scheduled_at', None) or task.request.eta
+    if scheduled_at:
+        try: TASK_LAG_SECONDS.labels(task.name).observe(max(time.time() - parse_timestamp(scheduled_at), 0))
+        except (TypeError, ValueError): pass
+
+@task_postrun.connect
+def on_task_postrun(task_id=None, task=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None: TASK_SECONDS.labels(task.name).observe(time.perf_counter() - started)
+
+@task_failure.connect
+def on_task_failure(sender=None, **kwargs):
+    TASK_FAILURES.labels(sender.name).inc()
+
+class QueueDepthCollector:
+    """Reports broker queue lengths and the Redis backlogs at scrape time."""
+    def collect(self):
+        from .sentiment import PENDING_KEY
+        from .fair_queue import pending_counts
+        gauge = GaugeMetricFamily('outreach_queue_depth', 'Messages waiting in each queue.', labels=['queue'])
+        try:
+            pipe = redis_client.pipeline()
+            for queue in BROKER_QUEUES: pipe.llen(queue)
+            pipe.llen(PENDING_KEY)
+            for queue, depth in zip(BROKER_QUEUES + ('sentiment_pending',), pipe.execute()): gauge.add_metric([queue], depth)
+            for kind, depth in pending_counts().items(): gauge.add_metric([f"fair_{kind}"], depth)
+        except Exception as e: print(f"ERROR reading queue depths for metrics: {e}")
+        yield gauge
+
+def build_registry():
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'): return REGISTRY
+    registry = CollectorRegistry(); multiprocess.MultiProcessCollector(registry)
+    return registry
+
+_web_registry = None
+
+def render_metrics():
+    """Return the web app's metrics, plus queue depths, in the Prometheus text format."""
+    global _web_registry
+    if _web_registry is None:
+        registry = build_registry(); registry.register(QueueDepthCollector()); _web_registry = registry
+    return generate_latest(_web_registry)
+
+@worker_ready.connect
+def start_worker_exporter(**kwargs):
+    try: start_http_server(WORKER_METRICS_PORT, registry=build_registry()); print(f"Serving worker metrics on port {WORKER_METRICS_PORT}.")
+    except OSError as e: print(f"ERROR starting worker metrics exporter: {e}")
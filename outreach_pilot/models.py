@@ -1,3 +1,4 @@
+from datetime import datetime
 from .extensions import db
 
 class EmailTemplate(db.Model):
@@ -6,3 +7,71 @@ class EmailTemplate(db.Model):
     body = db.Column(db.Text, nullable=False)
     is_default = db.Column(db.Boolean, default=False)
 
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class Campaign(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_email = db.Column(db.String(255), index=True)
+    sender_email = db.Column(db.String(255))
+    g_sheet_id = db.Column(db.String(255), nullable=False)
+    g_sheet_name = db.Column(db.String(255))
+    column_mappings = db.Column(db.Text, nullable=False)
+    num_followups = db.Column(db.Integer, nullable=False, default=1)
+    total_wait_seconds = db.Column(db.Integer, nullable=False)
+    check_frequency_seconds = db.Column(db.Integer, nullable=False)
+    use_random_followups = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    templates = db.relationship('CampaignTemplate', backref='campaign', order_by='CampaignTemplate.position', cascade='all, delete-orphan')
+
+class UserCredential(db.Model):
+    user_email = db.Column(db.String(255), primary_key=True)
+    refresh_token = db.Column(db.Text, nullable=False)
+    token_uri = db.Column(db.String(255))
+    scopes = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CampaignCheckpoint(db.Model):
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), primary_key=True)
+    sheet_name = db.Column(db.String(255), primary_key=True)
+    next_row = db.Column(db.Integer, nullable=False, default=2)
+    finished = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CampaignTemplate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+
+class Contact(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False, index=True)
+    sheet_name = db.Column(db.String(255), nullable=False)
+    email = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    fields = db.Column(db.Text, nullable=False, default='{}')
+    thread_id = db.Column(db.String(64), index=True)
+    followups_sent = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(50), nullable=False, default='PENDING')
+    wait_started_at = db.Column(db.DateTime)
+    claimed_at = db.Column(db.DateTime)
+
+class ScheduledAction(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    task_name = db.Column(db.String(200), nullable=False)
+    args = db.Column(db.Text, nullable=False)
+    kwargs = db.Column(db.Text, nullable=False, default='{}')
+    due_at = db.Column(db.DateTime, nullable=False, index=True)
+    key = db.Column(db.String(255), index=True)
+
+class ContactLedger(db.Model):
+    __table_args__ = (db.UniqueConstraint('sender_email', 'email', name='uq_contact_ledger_sender_email'),)
+    id = db.Column(db.Integer, primary_key=True)
+    sender_email = db.Column(db.String(255), nullable=False, index=True)
+    email = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='CONTACTED')
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
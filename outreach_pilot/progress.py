@@ -0,0 +1,52 @@
+import os
+import threading
+from .extensions import redis_client
+
+# Live per-campaign counters in a Redis hash, so the campaign page can follow
+# a campaign without reading the Google Sheet. Tasks bump them with HINCRBY
+# next to the matching Prometheus contact events; the campaigns blueprint
+# serves them as JSON and as a Server-Sent Events stream. Every contact ends
+# in exactly one of FINAL_FIELDS, so a campaign is done once its sheets are
+# read and those add up to `queued`. A stream holds a web thread, so each web
+# process serves at most PROGRESS_MAX_STREAMS at once; past that the page polls
+# the JSON endpoint instead.
+PROGRESS_FIELDS = ('queued', 'sent', 'followups_sent', 'replied', 'positive', 'neutral', 'negative', 'bounced', 'suppressed', 'failed', 'completed')
+FINAL_FIELDS = ('replied', 'bounced', 'suppressed', 'failed', 'completed')
+SENTIMENT_FIELDS = ('positive', 'neutral', 'negative')
+PROGRESS_TTL = int(os.environ.get('PROGRESS_TTL', 60 * 86400))
+PROGRESS_STREAM_INTERVAL = float(os.environ.get('PROGRESS_STREAM_INTERVAL', 2))
+PROGRESS_STREAM_SECONDS = int(os.environ.get('PROGRESS_STREAM_SECONDS', 300))
+PROGRESS_MAX_STREAMS = int(os.environ.get('PROGRESS_MAX_STREAMS', 2))
+PROGRESS_POLL_SECONDS = int(os.environ.get('PROGRESS_POLL_SECONDS', 10))
+_stream_slots = threading.BoundedSemaphore(PROGRESS_MAX_STREAMS)
+
+def progress_key(campaign_id):
+    return f"campaign:{campaign_id}:progress"
+
+def record_progress(campaign_id, **counts):
+    """Add to a campaign's counters, e.g. record_progress(7, sent=48, failed=2)."""
+    counts = {field: count for field, count in counts.items() if count}
+    if not counts: return
+    key = progress_key(campaign_id); pipe = redis_client.pipeline(transaction=True)
+    for field, count in counts.items(): pipe.hincrby(key, field, count)
+    pipe.expire(key, PROGRESS_TTL); pipe.execute()
+
+def finish_ingestion(campaign_id):
+    """Mark every worksheet as read, so `queued` is final."""
+    key = progress_key(campaign_id); pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(key, 'ingested', 1); pipe.expire(key, PROGRESS_TTL); pipe.execute()
+
+def claim_stream_slot():
+    return _stream_slots.acquire(blocking=False)
+
+def release_stream_slot():
+    _stream_slots.release()
+
+def get_progress(campaign_id):
+    raw = redis_client.hgetall(progress_key(campaign_id))
+    progress = {field: int(raw.get(field, 0)) for field in PROGRESS_FIELDS}
+    progress['finished'] = sum(progress[field] for field in FINAL_FIELDS)
+    progress['in_flight'] = max(progress['queued'] - progress['finished'], 0)
+    progress['ingested'] = bool(raw.get('ingested'))
+    progress['done'] = progress['ingested'] and progress['finished'] >= progress['queued'] and sum(progress[field] for field in SENTIMENT_FIELDS) >= progress['replied']
+    return progress
@@ -0,0 +1,127 @@
+import os
+import re
+import time
+from datetime import datetime, timezone
+from .extensions import redis_client
+
+# Token buckets shared by every worker through Redis, one per (API, sender
+# mailbox). Each bucket refills at an adaptive rate: quota errors halve it
+# (at most once per cooldown window) and successful calls add a small step
+# back, up to the API's ceiling. Callers reserve tokens before calling Google
+# and either sleep until the bucket allows it or reschedule themselves.
+#   api: (starting rate per second, floor, ceiling, burst)
+RATE_LIMITS = {
+    'gmail_send': (2.0, 0.05, 2.5, 20),
+    'gmail_read': (20.0, 1.0, 25.0, 50),
+    'sheets_write': (0.8, 0.05, 1.0, 5),
+    'sheets_read': (0.8, 0.05, 1.0, 5),
+}
+for _api in RATE_LIMITS:
+    if os.environ.get(f"RATE_LIMIT_{_api.upper()}"):
+        _rate = float(os.environ[f"RATE_LIMIT_{_api.upper()}"]); _, _floor, _, _burst = RATE_LIMITS[_api]
+        RATE_LIMITS[_api] = (_rate, min(_floor, _rate), _rate, _burst)
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 30))
+BACKOFF_FACTOR = 0.5
+BACKOFF_COOLDOWN = 5
+RECOVERY_STEP = 0.05
+# Gmail's daily sending cap gives no retry time; try again after this long.
+DAILY_LIMIT_BACKOFF = int(os.environ.get('DAILY_LIMIT_BACKOFF', 3600))
+RETRY_AFTER_RE = re.compile(r'Retry after (\d{4}-\d\d-\d\dT[\d:.]+Z)', re.I)
+
+# Refill the bucket, then take the tokens if enough are available. A request
+# larger than the burst is granted once the bucket is full and leaves it in
+# debt, so later callers wait for it to be paid off. Returns the seconds to
+# wait (as a string), or "0" when the tokens were taken.
+RESERVE_SCRIPT = redis_client.register_script("""
+local now_parts = redis.call('TIME'); local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local requested = tonumber(ARGV[1]); local capacity = tonumber(ARGV[3])
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[2])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or capacity)
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or now)
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local needed = math.min(requested, capacity); local wait = 0
+if tokens >= needed then tokens = tokens - requested else wait = (needed - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now), 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+""")
+
+# ARGV: starting rate, floor, ceiling, 'decrease' or 'increase', factor or step, cooldown.
+ADJUST_SCRIPT = redis_client.register_script("""
+local now_parts = redis.call('TIME'); local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[1])
+if ARGV[4] == 'decrease' then
+    local last = tonumber(redis.call('HGET', KEYS[1], 'decreased_at') or 0)
+    if now - last < tonumber(ARGV[6]) then return tostring(rate) end
+    rate = math.max(tonumber(ARGV[2]), rate * tonumber(ARGV[5]))
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or 0)
+    redis.call('HSET', KEYS[1], 'decreased_at', tostring(now), 'tokens', tostring(math.min(tokens, 0)), 'updated', tostring(now))
+else
+    rate = math.min(tonumber(ARGV[3]), rate + tonumber(ARGV[5]))
+end
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(rate)
+""")
+
+class RateLimited(Exception):
+    def __init__(self, api, key, wait):
+        super().__init__(f"{api} for {key} is rate limited for another {wait:.1f}s")
+        self.api = api; self.key = key; self.wait = wait
+
+def bucket_key(api, key):
+    return f"rate_limit:{api}:{key}"
+
+def reserve(api, key, tokens=1):
+    """Try to take `tokens` from the bucket; returns 0 on success or the seconds to wait."""
+    rate, _, _, burst = RATE_LIMITS[api]
+    return float(RESERVE_SCRIPT(keys=[bucket_key(api, key)], args=[tokens, rate, burst]))
+
+def throttle(api, key, tokens=1, max_wait=RATE_LIMIT_MAX_WAIT):
+    """Block until the tokens are granted; raises RateLimited if that would take longer than `max_wait`."""
+    waited = 0.0
+    while True:
+        wait = reserve(api, key, tokens)
+        if not wait: return waited
+        if waited + wait > max_wait: raise RateLimited(api, key, wait)
+        time.sleep(wait); waited += wait
+
+def report_quota_error(api, key):
+    rate, floor, ceiling, _ = RATE_LIMITS[api]
+    new_rate = float(ADJUST_SCRIPT(keys=[bucket_key(api, key)], args=[rate, floor, ceiling, 'decrease', BACKOFF_FACTOR, BACKOFF_COOLDOWN]))
+    print(f"WARNING: {api} quota exceeded for {key}; rate is now {new_rate:.2f}/s.")
+    return new_rate
+
+def report_success(api, key):
+    rate, floor, ceiling, _ = RATE_LIMITS[api]
+    return float(ADJUST_SCRIPT(keys=[bucket_key(api, key)], args=[rate, floor, ceiling, 'increase', ceiling * RECOVERY_STEP, BACKOFF_COOLDOWN]))
+
+def backoff_seconds(api, key, tokens=1):
+    """How long a caller that was throttled by Google should wait before trying `tokens` calls again."""
+    rate, _, _, burst = RATE_LIMITS[api]
+    current = redis_client.hget(bucket_key(api, key), 'rate')
+    return max(1.0, min(tokens, burst) / float(current or rate))
+
+def error_response(error):
+    return getattr(error, 'resp', None) or getattr(error, 'response', None)
+
+def error_details(error):
+    details = getattr(error, 'content', b'') or b''
+    return (details.decode('utf-8', 'replace') if isinstance(details, bytes) else str(details)) + str(error)
+
+def is_quota_error(error):
+    """True for Gmail/Sheets responses that mean a rate or quota limit was hit."""
+    response = error_response(error)
+    status = getattr(response, 'status', None) or getattr(response, 'status_code', None)
+    if status is not None and int(status) == 429: return True
+    if status is None or int(status) != 403: return False
+    return any(reason in error_details(error) for reason in ('rateLimitExceeded', 'userRateLimitExceeded', 'dailyLimitExceeded', 'quotaExceeded', 'RESOURCE_EXHAUSTED'))
+
+def quota_retry_seconds(error):
+    """Seconds Google asked us to wait before retrying (Retry-After header or "Retry after <time>"), or 0 if it did not say."""
+    response = error_response(error); headers = getattr(response, 'headers', response)
+    retry_after = (headers.get('retry-after') or headers.get('Retry-After')) if hasattr(headers, 'get') else None
+    if retry_after and str(retry_after).strip().isdigit(): return float(retry_after)
+    details = error_details(error); match = RETRY_AFTER_RE.search(details)
+    if match: return max((datetime.fromisoformat(match[1].replace('Z', '+00:00')) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    return float(DAILY_LIMIT_BACKOFF) if 'dailyLimitExceeded' in details else 0.0
@@ -0,0 +1,44 @@
+import re
+from functools import lru_cache
+
+# Email templates are compiled once into a tuple of segments that alternates
+# literal text and field names, so personalising a message is one join over
+# the contact's fields instead of a str.replace pass per placeholder. A
+# placeholder is any sheet column name in braces, e.g. {Company} or
+# {First Name}; matching ignores case and surrounding spaces. {name} and
+# {dr_name} always refer to the mapped name column and {email} to the mapped
+# email column.
+PLACEHOLDER_RE = re.compile(r'\{\s*([A-Za-z_][\w \-]{0,63}?)\s*\}')
+NAME_ALIASES = ('name', 'dr_name')
+
+def field_key(name):
+    return ' '.join(str(name).split()).lower()
+
+@lru_cache(maxsize=512)
+def compile_template(text):
+    """Split `text` into (literal, field, literal, field, ..., literal)."""
+    segments = []; position = 0
+    for match in PLACEHOLDER_RE.finditer(text or ''):
+        segments.append(text[position:match.start()]); segments.append(field_key(match.group(1))); position = match.end()
+    segments.append((text or '')[position:])
+    return tuple(segments)
+
+def template_fields(text):
+    return set(compile_template(text)[1::2])
+
+def render_compiled(segments, fields):
+    parts = list(segments)
+    for i in range(1, len(parts), 2): parts[i] = fields.get(parts[i], '')
+    return ''.join(parts)
+
+def contact_fields(row, name, email):
+    """Map every column of a sheet row, plus the name/email aliases, to its string value."""
+    fields = {field_key(column): '' if value is None else str(value) for column, value in row.items() if str(column).strip()}
+    for alias in NAME_ALIASES: fields[alias] = str(name)
+    fields['email'] = str(email)
+    return fields
+
+def missing_fields(texts, headers):
+    """Return the placeholders used in `texts` that no header or alias can fill."""
+    available = {field_key(header) for header in headers} | set(NAME_ALIASES) | {'email'}
+    return sorted(set().union(*(template_fields(text) for text in texts)) - available)
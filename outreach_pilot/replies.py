@@ -0,0 +1,61 @@
+import os
+from .extensions import redis_client
+
+# Reply tracking per sender mailbox. Every thread awaiting a reply is registered
+# in a Redis hash mapping its thread ID to the contact ID; a single scanner per
+# mailbox reads the Gmail history since its last checkpoint and only re-checks
+# the watched threads that actually received new mail.
+REPLY_IGNORE_TTL = int(os.environ.get('REPLY_IGNORE_TTL', 90 * 86400))
+
+def watch_key(sender_email):
+    return f"reply_watch:{sender_email}"
+
+def reply_check_key(contact_id):
+    return f"reply_check:{contact_id}"
+
+def reply_scan_key(sender_email):
+    return f"reply_scan:{sender_email}"
+
+def watch_thread(sender_email, thread_id, contact_id):
+    redis_client.hset(watch_key(sender_email), thread_id, contact_id)
+
+def watch_threads(sender_email, contacts_by_thread):
+    if contacts_by_thread: redis_client.hset(watch_key(sender_email), mapping=contacts_by_thread)
+
+def unwatch_thread(sender_email, thread_id):
+    redis_client.hdel(watch_key(sender_email), thread_id)
+
+def get_watched_threads(sender_email, thread_ids=None):
+    """Return {thread_id: contact_id} for all (or the given) watched threads."""
+    key = watch_key(sender_email)
+    if thread_ids is None: raw = redis_client.hgetall(key)
+    else: thread_ids = list(thread_ids); raw = dict(zip(thread_ids, redis_client.hmget(key, thread_ids))) if thread_ids else {}
+    return {thread_id: int(contact_id) for thread_id, contact_id in raw.items() if contact_id}
+
+def count_watched_threads(sender_email):
+    return redis_client.hlen(watch_key(sender_email))
+
+def get_history_checkpoint(sender_email):
+    return redis_client.get(f"reply_history:{sender_email}")
+
+def set_history_checkpoint(sender_email, history_id, only_if_missing=False):
+    redis_client.set(f"reply_history:{sender_email}", history_id, nx=only_if_missing)
+
+def ignore_messages(contact_id, message_ids):
+    """Remember auto-replies and delay notices in a contact's thread so later checks skip them."""
+    if not message_ids: return
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.sadd(f"reply_ignored:{contact_id}", *message_ids); pipe.expire(f"reply_ignored:{contact_id}", REPLY_IGNORE_TTL); pipe.execute()
+
+def ignored_messages(contact_id):
+    return redis_client.smembers(f"reply_ignored:{contact_id}")
+
+def get_bounce_checkpoint(sender_email):
+    return redis_client.get(f"bounce_sweep:{sender_email}")
+
+def set_bounce_checkpoint(sender_email, timestamp):
+    redis_client.set(f"bounce_sweep:{sender_email}", int(timestamp))
+
+def scan_schedule_lock(sender_email):
+    """Held while adding the mailbox's next scan, so concurrent callers add only one."""
+    return redis_client.lock(f"{reply_scan_key(sender_email)}:lock", timeout=60, blocking_timeout=0)
@@ -0,0 +1,51 @@
+import os
+import json
+from datetime import datetime, timedelta
+from .extensions import db
+from .models import ScheduledAction
+
+# Persistent schedule for delayed tasks. Follow-up timing used to live in Celery
+# countdowns, which workers hold in memory and Redis redelivers once the
+# visibility timeout expires. Pending work now sits in the scheduled_action
+# table until it is due and costs nothing until then; dispatch_due_actions
+# claims due rows in batches and publishes them as ordinary Celery messages.
+SCHEDULER_INTERVAL = int(os.environ.get('SCHEDULER_INTERVAL', 30))
+SCHEDULER_BATCH_SIZE = int(os.environ.get('SCHEDULER_BATCH_SIZE', 500))
+
+def new_action(task_name, args, kwargs=None, delay_seconds=0, key=None):
+    due_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+    return ScheduledAction(task_name=task_name, args=json.dumps(args), kwargs=json.dumps(kwargs or {}), due_at=due_at, key=key)
+
+def schedule_task(task_name, args, kwargs=None, delay_seconds=0, key=None):
+    """Schedule one task, replacing any pending action with the same key."""
+    if key: ScheduledAction.query.filter_by(key=key).delete()
+    db.session.add(new_action(task_name, args, kwargs, delay_seconds, key))
+    db.session.commit()
+
+def schedule_tasks(actions):
+    """Insert many actions built with new_action in a single commit."""
+    if not actions: return
+    db.session.add_all(actions)
+    db.session.commit()
+
+def is_scheduled(key):
+    return db.session.query(ScheduledAction.query.filter_by(key=key).exists()).scalar()
+
+def cancel_scheduled(key):
+    ScheduledAction.query.filter_by(key=key).delete()
+    db.session.commit()
+
+def claim_due_actions(limit=SCHEDULER_BATCH_SIZE):
+    """Lock and return up to `limit` due actions.
+
+    On Postgres rows are locked with FOR UPDATE SKIP LOCKED, so several
+    dispatchers can run at once without claiming the same rows. Callers must
+    delete the rows they handled and commit to release the locks.
+    """
+    query = ScheduledAction.query.filter(ScheduledAction.due_at <= datetime.utcnow()).order_by(ScheduledAction.due_at).limit(limit)
+    if db.engine.dialect.name == 'postgresql': query = query.with_for_update(skip_locked=True)
+    return query.all()
+
+def complete_actions(actions):
+    ScheduledAction.query.filter(ScheduledAction.id.in_([action.id for action in actions])).delete(synchronize_session=False)
+    db.session.commit()
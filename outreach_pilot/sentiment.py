@@ -0,0 +1,43 @@
+import os
+import json
+from functools import lru_cache
+from .extensions import redis_client
+
+# Reply sentiment is scored off the polling path. check_for_reply pushes each
+# cleaned reply onto a Redis list and score_pending_replies, which runs on the
+# 'sentiment' queue, scores whole batches with one VADER analyzer per worker
+# process and writes the labels back in bulk.
+SENTIMENT_BATCH_SIZE = int(os.environ.get('SENTIMENT_BATCH_SIZE', 100))
+SENTIMENT_BATCH_INTERVAL = int(os.environ.get('SENTIMENT_BATCH_INTERVAL', 15))
+PENDING_KEY = 'sentiment_pending'
+
+@lru_cache(maxsize=None)
+def get_analyzer():
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+def sentiment_label(score):
+    return "Positive" if score >= 0.05 else "Negative" if score <= -0.05 else "Neutral"
+
+def score_texts(texts):
+    analyzer = get_analyzer()
+    return [sentiment_label(analyzer.polarity_scores(text)['compound']) for text in texts]
+
+def queue_reply(contact_id, reply_content):
+    """Add a reply to the scoring queue and return the number of replies waiting."""
+    return redis_client.rpush(PENDING_KEY, json.dumps({'contact_id': contact_id, 'text': reply_content}))
+
+def take_pending_replies(limit=SENTIMENT_BATCH_SIZE):
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.lrange(PENDING_KEY, 0, limit - 1); pipe.ltrim(PENDING_KEY, limit, -1)
+    return [json.loads(item) for item in pipe.execute()[0]]
+
+def restore_pending_replies(items):
+    if items: redis_client.lpush(PENDING_KEY, *[json.dumps(item) for item in reversed(items)])
+
+def claim_scoring_slot():
+    """Return True if the caller should schedule the next timed scoring run."""
+    return bool(redis_client.set(f"{PENDING_KEY}:scheduled", 1, nx=True, ex=SENTIMENT_BATCH_INTERVAL * 6))
+
+def release_scoring_slot():
+    redis_client.delete(f"{PENDING_KEY}:scheduled")
@@ -0,0 +1,165 @@
+import os
+import json
+from datetime import datetime
+from .extensions import redis_client
+from .metrics import observed, observe_call
+from .rate_limit import throttle
+
+# Write-behind buffer for contact status updates. Tasks append row updates to a
+# Redis list per (spreadsheet, worksheet); a single flusher per worksheet drains
+# the list, merges updates per contact in arrival order and writes them with one
+# values batch_update, so a burst of status changes costs two Sheets calls.
+SHEET_FLUSH_SIZE = int(os.environ.get('SHEET_FLUSH_SIZE', 200))
+SHEET_FLUSH_INTERVAL = int(os.environ.get('SHEET_FLUSH_INTERVAL', 10))
+SHEET_FLUSH_MAX_ROWS = int(os.environ.get('SHEET_FLUSH_MAX_ROWS', 2000))
+SHEET_READ_CHUNK_ROWS = int(os.environ.get('SHEET_READ_CHUNK_ROWS', 1000))
+INGESTION_LOCK_TIMEOUT = int(os.environ.get('INGESTION_LOCK_TIMEOUT', 600))
+
+def buffer_key(g_sheet_id, sheet_name):
+    return f"sheet_writes:{g_sheet_id}:{sheet_name}"
+
+def buffer_row_updates(g_sheet_id, sheet_name, row_updates):
+    """Append updates to the worksheet buffer and return its new length."""
+    if not row_updates: return redis_client.llen(buffer_key(g_sheet_id, sheet_name))
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    items = [json.dumps({'email': email, 'data': data, 'at': timestamp}) for email, data in row_updates.items()]
+    return redis_client.rpush(buffer_key(g_sheet_id, sheet_name), *items)
+
+def claim_flush_slot(g_sheet_id, sheet_name):
+    """Return True if the caller should schedule the next timed flush."""
+    return bool(redis_client.set(f"{buffer_key(g_sheet_id, sheet_name)}:scheduled", 1, nx=True, ex=SHEET_FLUSH_INTERVAL * 6))
+
+def release_flush_slot(g_sheet_id, sheet_name):
+    redis_client.delete(f"{buffer_key(g_sheet_id, sheet_name)}:scheduled")
+
+def flush_lock(g_sheet_id, sheet_name):
+    return redis_client.lock(f"{buffer_key(g_sheet_id, sheet_name)}:lock", timeout=300, blocking_timeout=0)
+
+def ingestion_lock(campaign_id):
+    """Held while a campaign's worksheets are read; renewed after every chunk."""
+    return redis_client.lock(f"campaign_ingest:{campaign_id}", timeout=INGESTION_LOCK_TIMEOUT, blocking_timeout=0)
+
+def take_buffered_updates(g_sheet_id, sheet_name, limit=SHEET_FLUSH_MAX_ROWS):
+    key = buffer_key(g_sheet_id, sheet_name)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.lrange(key, 0, limit - 1); pipe.ltrim(key, limit, -1)
+    return pipe.execute()[0]
+
+def restore_buffered_updates(g_sheet_id, sheet_name, items):
+    # Put unwritten updates back at the head so they stay ahead of newer ones.
+    if items: redis_client.lpush(buffer_key(g_sheet_id, sheet_name), *reversed(items))
+
+def merge_row_updates(items):
+    """Collapse buffered items into {email: (data, timestamp)}, later values winning."""
+    merged = {}
+    for raw in items:
+        item = json.loads(raw)
+        data, _ = merged.get(item['email'], ({}, None))
+        data.update(item['data']); merged[item['email']] = (data, item['at'])
+    return merged
+
+def index_key(g_sheet_id, sheet_name):
+    return f"sheet_index:{g_sheet_id}:{sheet_name}"
+
+def normalize_email(email):
+    return str(email).strip().lower()
+
+def reset_row_index(g_sheet_id, sheet_name, email_col):
+    """Start a fresh email -> row number index for a worksheet whose email column is `email_col` (1-based)."""
+    key = index_key(g_sheet_id, sheet_name)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(key, f"{key}:meta")
+    pipe.hset(f"{key}:meta", mapping={'email_col': email_col})
+    pipe.execute()
+
+def extend_row_index(g_sheet_id, sheet_name, first_row, emails):
+    """Index a run of consecutive rows starting at `first_row`; an email keeps its first row."""
+    key = index_key(g_sheet_id, sheet_name); pipe = redis_client.pipeline(transaction=False)
+    for row_number, email in enumerate(emails, start=first_row):
+        if email: pipe.hsetnx(key, normalize_email(email), row_number)
+    pipe.execute()
+
+def iter_sheet_rows(sheet, num_cols, chunk_rows=SHEET_READ_CHUNK_ROWS, start_row=2, rate_key=None):
+    """Yield (first row number, rows) over the data rows of a worksheet from `start_row` to its last grid row, one ranged read per chunk.
+
+    With `rate_key`, every read first takes a token from that mailbox's sheets_read bucket.
+    """
+    from gspread.utils import rowcol_to_a1
+    start = start_row
+    while start <= sheet.row_count:
+        end = min(start + chunk_rows - 1, sheet.row_count)
+        if rate_key: throttle('sheets_read', rate_key)
+        with observe_call('sheets', 'read'): rows = sheet.get(f"A{start}:{rowcol_to_a1(end, num_cols)}")
+        # The API drops the range's trailing empty rows, which says nothing about the rows
+        # after it; pad them back so every chunk covers its whole range and rows stay numbered.
+        yield start, rows + [[] for _ in range(end - start + 1 - len(rows))]
+        start = end + 1
+
+def refresh_row_index(sheet, email_col):
+    """Re-read the email column and update only the index entries that moved."""
+    key = index_key(sheet.spreadsheet_id, sheet.title); current = redis_client.hgetall(key); fresh = {}
+    for row_number, email in enumerate(sheet.col_values(email_col)[1:], start=2):
+        if email: fresh.setdefault(normalize_email(email), row_number)
+    moved = {email: row for email, row in fresh.items() if current.get(email) != str(row)}
+    removed = [email for email in current if email not in fresh]
+    pipe = redis_client.pipeline(transaction=True)
+    if moved: pipe.hset(key, mapping=moved)
+    if removed: pipe.hdel(key, *removed)
+    pipe.execute()
+    if moved or removed: print(f"Re-indexed sheet '{sheet.title}': {len(moved)} rows moved, {len(removed)} removed.")
+    return fresh
+
+@observed('sheets', 'find')
+def locate_rows(sheet, emails):
+    """Return the header row and {email: row number} for the given emails.
+
+    Indexed rows are verified with a single batch read of the header row and
+    the email column between the first and last indexed row (one range, so
+    the request URL stays short however many emails are flushed); any mismatch means rows were inserted or deleted, so the index is
+    refreshed from the email column. Worksheets without an index fall back to
+    scanning every cell, as gspread's find does.
+    """
+    from gspread.utils import rowcol_to_a1
+    key = index_key(sheet.spreadsheet_id, sheet.title); meta = redis_client.hgetall(f"{key}:meta")
+    if not meta:
+        values = sheet.get_all_values(); cell_rows = {}
+        for row_number, row in enumerate(values, start=1):
+            for value in row: cell_rows.setdefault(value, row_number)
+        return (values[0] if values else []), {email: cell_rows[email] for email in emails if email in cell_rows}
+    email_col = int(meta['email_col'])
+    indexed = dict(zip(emails, redis_client.hmget(key, [normalize_email(email) for email in emails])))
+    candidates = {email: int(row) for email, row in indexed.items() if row}
+    first_row, last_row = (min(candidates.values()), max(candidates.values())) if candidates else (2, 2)
+    results = sheet.batch_get(['1:1', f"{rowcol_to_a1(first_row, email_col)}:{rowcol_to_a1(last_row, email_col)}"])
+    headers = results[0][0] if results[0] else []; column = results[1] or []
+    stale = len(candidates) < len(emails); rows = {}
+    for email, row in candidates.items():
+        cell = column[row - first_row] if row - first_row < len(column) else []
+        if normalize_email(cell[0] if cell else '') == normalize_email(email): rows[email] = row
+        else: stale = True
+    if stale:
+        fresh = refresh_row_index(sheet, email_col)
+        rows = {email: fresh[normalize_email(email)] for email in emails if normalize_email(email) in fresh}
+    return headers, rows
+
+def write_row_updates(sheet, merged_updates):
+    """Write merged updates to `sheet` with one lookup read and one batch write."""
+    from gspread.utils import rowcol_to_a1
+    headers, row_numbers = locate_rows(sheet, list(merged_updates))
+    headers = list(headers); header_map = {header: i for i, header in enumerate(headers)}
+    found_updates = {}
+    for email, update in merged_updates.items():
+        if email in row_numbers: found_updates[email] = update
+        else: print(f"WARNING: '{email}' not found in sheet '{sheet.title}'. Skipping update.")
+    if not found_updates: return 0
+    data = []; new_headers = []
+    for data_to_update, _ in found_updates.values():
+        new_headers += [h for h in data_to_update.keys() if h not in header_map and h not in new_headers]
+    if "Timestamp" not in header_map and "Timestamp" not in new_headers: new_headers.append("Timestamp")
+    for header in new_headers:
+        data.append({'range': rowcol_to_a1(1, len(headers) + 1), 'values': [[header]]}); header_map[header] = len(headers); headers.append(header)
+    for email, (data_to_update, timestamp) in found_updates.items():
+        for header, value in dict(data_to_update, Timestamp=timestamp).items():
+            data.append({'range': rowcol_to_a1(row_numbers[email], header_map[header] + 1), 'values': [[str(value)]]})
+    with observe_call('sheets', 'update'): sheet.batch_update(data)
+    return len(found_updates)
@@ -1,20 +1,66 @@
 import os
-import gspread
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import json
+import time
 from datetime import datetime, timedelta
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 import base64
 import re
-from celery import Celery, group
-import random
-from .models import EmailTemplate
+from celery import Celery
+from .extensions import db, redis_client
+from .models import Campaign, CampaignCheckpoint, Contact, ScheduledAction
+from .template_cache import random_template
+from .metrics import record_contacts
+from .progress import record_progress, finish_ingestion
+from .fair_queue import FAIR_MAX_BACKLOG, FAIR_PUMP_INTERVAL, enqueue, restore, take_fair_share, pump_lock
+from .campaign_cache import get_campaign_settings
+from .credential_store import load_credentials
+from .ledger import claim_addresses, addresses_claimed_by, release_addresses, suppress_addresses, suppressed_addresses
+from .bounces import CLASSIFY_HEADERS, BOUNCE_SEARCH, classify_message, failed_recipients
+from .renderer import render_compiled, contact_fields, missing_fields
+from .drive_cache import list_all_spreadsheets, store_listing, release_refresh
+from .gmail import get_profile, send_message, send_gmail_batch, get_thread_message_ids, get_thread_message_ids_batch, get_message, get_message_metadata, list_message_ids, list_history_thread_ids
+from .google_clients import get_gmail_service, get_gspread_client, get_drive_service
+from .replies import reply_check_key, watch_thread, watch_threads, unwatch_thread, get_watched_threads, count_watched_threads, get_history_checkpoint, set_history_checkpoint, ignore_messages, ignored_messages, get_bounce_checkpoint, set_bounce_checkpoint, reply_scan_key, scan_schedule_lock
+from .rate_limit import RateLimited, throttle, report_quota_error, report_success, backoff_seconds, is_quota_error, quota_retry_seconds
+from .sentiment import SENTIMENT_BATCH_SIZE, SENTIMENT_BATCH_INTERVAL, score_texts, queue_reply, take_pending_replies, restore_pending_replies, claim_scoring_slot, release_scoring_slot
+from .scheduler import SCHEDULER_INTERVAL, SCHEDULER_BATCH_SIZE, new_action, schedule_task, schedule_tasks, is_scheduled, cancel_scheduled, claim_due_actions, complete_actions
+from .sheets import normalize_email, SHEET_FLUSH_SIZE, SHEET_FLUSH_INTERVAL, buffer_row_updates, claim_flush_slot, release_flush_slot, flush_lock, take_buffered_updates, restore_buffered_updates, merge_row_updates, write_row_updates, reset_row_index, extend_row_index, iter_sheet_rows, ingestion_lock
 
 redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 celery = Celery('tasks', broker=redis_url, backend=redis_url)
 
+SEND_BATCH_SIZE = int(os.environ.get('SEND_BATCH_SIZE', 50))
+# Throttled batches waiting longer than this are parked in scheduled_action
+# rather than in a countdown the broker would redeliver.
+SEND_COUNTDOWN_MAX = int(os.environ.get('SEND_COUNTDOWN_MAX', 300))
+# A SENDING claim older than this belongs to a batch whose worker died.
+SEND_CLAIM_TIMEOUT = int(os.environ.get('SEND_CLAIM_TIMEOUT', 900))
+# Tasks that spend nearly all their time waiting on Google run on the 'io'
+# queue, served by a thread-pool worker that keeps many calls in flight per process.
+# They call release_connection before each Google call or throttle, so only the
+# threads that are talking to the database hold a connection.
+IO_QUEUE = os.environ.get('IO_QUEUE', 'io')
+# A reply check that fails for any reason other than quota is tried again this
+# much later, so the contact keeps its place in the follow-up sequence.
+REPLY_CHECK_RETRY_SECONDS = int(os.environ.get('REPLY_CHECK_RETRY_SECONDS', 300))
+
+FINISHED_STATUSES = ('SEND_FAILED', 'REPLIED', 'COMPLETED_NO_REPLY', 'SUPPRESSED', 'BOUNCED')
+
+celery.conf.beat_schedule = {
+    'dispatch-due-actions': {'task': 'outreach_pilot.tasks.dispatch_due_actions', 'schedule': SCHEDULER_INTERVAL},
+    'pump-fair-queues': {'task': 'outreach_pilot.tasks.pump_fair_queues', 'schedule': FAIR_PUMP_INTERVAL},
+}
+# pump_fair_queues and dispatch_due_actions stay on the default queue served by
+# the beat worker, so they never wait behind the io backlog they meter.
+celery.conf.task_routes = {
+    'outreach_pilot.tasks.score_pending_replies': {'queue': 'sentiment'},
+    'outreach_pilot.tasks.send_contact_batch': {'queue': IO_QUEUE},
+    'outreach_pilot.tasks.check_for_reply': {'queue': IO_QUEUE},
+    'outreach_pilot.tasks.flush_sheet_updates': {'queue': IO_QUEUE},
+}
+# Workers reserve one message per slot so the broker backlog, which the fair
+# queue pump keeps short, is what decides what runs next.
+celery.conf.worker_prefetch_multiplier = 1
+
 def calculate_seconds(value, unit):
     if unit == 'seconds': return value
     if unit == 'minutes': return value * 60
@@ -24,25 +70,14 @@ def calculate_seconds(value, unit):
     if unit == 'months': return value * 30 * 86400
     return value * 86400
 
-def send_gmail_message(service, to, subject, body):
-    try:
-        profile = service.users().getProfile(userId='me').execute()
-        sender_email = profile['emailAddress']
-        message = MIMEMultipart(); message['to'] = to; message['subject'] = subject
-        message['from'] = f"iTranscript360 <{sender_email}>"
-        message.attach(MIMEText(body, 'html'))
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        sent_message = service.users().messages().send(userId="me", body={'raw': raw_message}).execute()
-        return sent_message.get('threadId')
-    except Exception as e:
-        print(f"ERROR sending email to {to}: {e}"); return None
+# Everything from the first quoted-reply marker onwards is dropped.
+QUOTED_REPLY_RE = re.compile(r'(?i:\nOn .*wrote:)|From:.*|Sent:.*')
 
 def clean_reply_content(full_body):
-    cleaned_body = re.split(r'\nOn .*wrote:', full_body, flags=re.IGNORECASE)[0]
-    cleaned_body = re.split(r'From:.*', cleaned_body)[0]
-    cleaned_body = re.split(r'Sent:.*', cleaned_body)[0]
+    match = QUOTED_REPLY_RE.search(full_body)
+    cleaned_body = full_body[:match.start()] if match else full_body
     lines = cleaned_body.splitlines()
-    non_quoted_lines = [line for line in lines if not line.strip().startswith('>')]
+    non_quoted_lines = [line for line in lines if not line.lstrip().startswith('>')]
     return "\n".join(non_quoted_lines).strip()
 
 def get_reply_body(message_part):
@@ -55,99 +90,502 @@ def get_reply_body(message_part):
             if body: return body
     return ""
 
-@celery.task
-def start_outreach_campaign(credentials_dict, g_sheet_id, column_mappings, num_followups, total_wait_time_value, total_wait_time_unit, check_frequency_value, check_frequency_unit, campaign_templates, use_random_followups):
-    creds = Credentials(**credentials_dict); gc = gspread.authorize(creds)
-    workbook = gc.open_by_key(g_sheet_id); job_signatures = []
-    for sheet_name, mappings in column_mappings.items():
+@celery.task(bind=True)
+def start_outreach_campaign(self, campaign_id):
+    # One reader per campaign: a second run would take back the ledger claims of
+    # the chunk the first one is still saving and create duplicate contacts.
+    # A throttled or rate-limited read runs the task again later; the worksheet
+    # checkpoints make it continue from the last saved chunk.
+    lock = ingestion_lock(campaign_id)
+    if not lock.acquire(): print(f"Campaign {campaign_id} is already being read by another worker."); return None
+    try: return read_campaign_sheets(self, campaign_id, lock)
+    except Exception as e:
+        if not isinstance(e, RateLimited) and not is_quota_error(e): raise
+        db.session.rollback()
+        if isinstance(e, RateLimited): wait = e.wait
+        else:
+            sender_email = db.session.get(Campaign, campaign_id).sender_email or str(campaign_id)
+            report_quota_error('sheets_read', sender_email); wait = backoff_seconds('sheets_read', sender_email)
+        print(f"Reading campaign {campaign_id} was throttled; continuing in {wait:.0f}s.")
+        start_outreach_campaign.apply_async(args=[campaign_id], countdown=wait)
+    finally: lock.release()
+
+def read_campaign_sheets(task, campaign_id, lock):
+    # Worksheets are read in fixed-size row ranges and each chunk's contacts are
+    # saved and handed to send_contact_batch before the next chunk is read, so
+    # sending starts right away and memory does not grow with the sheet. Each
+    # worksheet's next unread row is committed together with the chunk's
+    # contacts, so running the task again continues where it stopped.
+    from gspread.exceptions import WorksheetNotFound
+    campaign = db.session.get(Campaign, campaign_id); credentials_dict = load_credentials(campaign.user_email)
+    profile = get_profile(get_gmail_service(credentials_dict)); sender_email = profile['emailAddress']
+    campaign.sender_email = sender_email; db.session.commit()
+    set_history_checkpoint(sender_email, profile['historyId'], only_if_missing=True)
+    gc = get_gspread_client(credentials_dict)
+    # Random follow-ups only use library templates the contact's columns can fill, so only the campaign's own are checked.
+    template_texts = [text for template in campaign.templates for text in (template.subject, template.body)]
+    tenant = campaign.user_email or sender_email
+    workbook = gc.open_by_key(campaign.g_sheet_id); progress = {'rows_read': 0, 'contacts_dispatched': 0, 'batches_dispatched': 0, 'duplicates_skipped': 0}
+    checkpoints = {checkpoint.sheet_name: checkpoint for checkpoint in CampaignCheckpoint.query.filter_by(campaign_id=campaign_id)}
+    for sheet_name, mappings in json.loads(campaign.column_mappings).items():
         name_column = mappings['name']; email_column = mappings['email']
+        checkpoint = checkpoints.get(sheet_name)
+        if checkpoint is None: checkpoint = CampaignCheckpoint(campaign_id=campaign_id, sheet_name=sheet_name, next_row=2, finished=False); db.session.add(checkpoint)
+        if checkpoint.finished: continue
+        resuming = checkpoint.next_row > 2
         try:
-            worksheet = workbook.worksheet(sheet_name)
-            contacts = worksheet.get_all_records(head=1)
-            for contact in contacts:
-                contact_stripped = {k.strip(): v for k,v in contact.items()}
-                if not contact_stripped.get("Send Status") or contact_stripped.get("Send Status") == "":
-                    contact_email = contact_stripped.get(email_column)
-                    contact_name = contact_stripped.get(name_column)
-                    if not contact_email or not contact_name:
-                        print(f"Skipping row in '{sheet_name}'. Mapped Name='{name_column}', Mapped Email='{email_column}'. Data: {contact_stripped}"); continue
-                    task_sig = process_single_contact.s(credentials_dict, g_sheet_id, sheet_name, contact_email, contact_name, num_followups, total_wait_time_value, total_wait_time_unit, check_frequency_value, check_frequency_unit, campaign_templates, use_random_followups)
-                    job_signatures.append(task_sig)
-        except gspread.exceptions.WorksheetNotFound:
+            throttle('sheets_read', sender_email); worksheet = workbook.worksheet(sheet_name)
+            headers = [header.strip() for header in worksheet.row_values(1)]
+            if not headers: continue
+            unknown_fields = missing_fields(template_texts, headers)
+            if unknown_fields:
+                print(f"ERROR: Templates use placeholders {unknown_fields} with no matching column in '{sheet_name}'. Skipping."); continue
+            email_col = headers.index(email_column) + 1 if email_column in headers else None
+            if email_col and not resuming: reset_row_index(campaign.g_sheet_id, sheet_name, email_col)
+            for first_row, rows in iter_sheet_rows(worksheet, len(headers), start_row=checkpoint.next_row, rate_key=sender_email):
+                contacts = [dict(zip(headers, row + [''] * (len(headers) - len(row)))) for row in rows]; candidates = []; pending_contacts = []
+                if email_col: extend_row_index(campaign.g_sheet_id, sheet_name, first_row, [contact.get(email_column) for contact in contacts])
+                for contact_stripped in contacts:
+                    if not any(contact_stripped.values()): continue
+                    if not contact_stripped.get("Send Status") or contact_stripped.get("Send Status") == "":
+                        contact_email = contact_stripped.get(email_column)
+                        contact_name = contact_stripped.get(name_column)
+                        if not contact_email or not contact_name:
+                            print(f"Skipping row in '{sheet_name}'. Mapped Name='{name_column}', Mapped Email='{email_column}'. Data: {contact_stripped}"); continue
+                        candidates.append((contact_stripped, contact_email, contact_name))
+                # Addresses this mailbox already emailed (in any campaign or worksheet) or suppressed are skipped.
+                claimed = claim_addresses(sender_email, campaign_id, [contact_email for _, contact_email, _ in candidates])
+                if resuming:
+                    # The chunk that was in progress when the last run stopped may hold addresses
+                    # this campaign claimed but never saved as contacts; take those back.
+                    held = addresses_claimed_by(sender_email, campaign_id, [contact_email for _, contact_email, _ in candidates]) - claimed
+                    saved = {normalize_email(email) for (email,) in db.session.query(Contact.email).filter(Contact.campaign_id == campaign_id, db.func.lower(Contact.email).in_(held))} if held else set()
+                    claimed |= held - saved; resuming = False
+                for contact_stripped, contact_email, contact_name in candidates:
+                    if normalize_email(contact_email) not in claimed: progress['duplicates_skipped'] += 1; continue
+                    claimed.discard(normalize_email(contact_email))
+                    fields = contact_fields(contact_stripped, contact_name, contact_email)
+                    pending_contacts.append(Contact(campaign_id=campaign_id, sheet_name=sheet_name, email=str(contact_email), name=str(contact_name), fields=json.dumps(fields)))
+                db.session.add_all(pending_contacts); db.session.flush(); checkpoint.next_row = first_row + len(rows)
+                contact_ids = [contact.id for contact in pending_contacts]; db.session.commit(); record_progress(campaign_id, queued=len(contact_ids))
+                batches = [(send_contact_batch.name, [campaign_id, contact_ids[start:start + SEND_BATCH_SIZE]], None, None) for start in range(0, len(contact_ids), SEND_BATCH_SIZE)]
+                enqueue('initial_send', tenant, batches); progress['batches_dispatched'] += len(batches); publish_fair_share()
+                progress['rows_read'] += len(rows); progress['contacts_dispatched'] += len(contact_ids)
+                if task.request.id: task.update_state(state='PROGRESS', meta=progress)
+                lock.reacquire()
+                print(f"Campaign {campaign_id}: read {progress['rows_read']} rows, dispatched {progress['contacts_dispatched']} contacts so far, skipped {progress['duplicates_skipped']} already contacted or suppressed.")
+            checkpoint.finished = True; db.session.commit()
+        except WorksheetNotFound:
             print(f"ERROR: Worksheet '{sheet_name}' not found. Skipping."); continue
-    if job_signatures:
-        job_group = group(job_signatures); job_group.apply_async()
-        print(f"Dispatched a group of {len(job_signatures)} tasks to the workers.")
+    finish_ingestion(campaign_id)
+    print(f"Dispatched {progress['batches_dispatched']} send batches covering {progress['contacts_dispatched']} contacts to the workers.")
+    return progress
 
 @celery.task
-def process_single_contact(credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, contact_name, num_followups, total_wait_time_value, total_wait_time_unit, check_frequency_value, check_frequency_unit, campaign_templates, use_random_followups):
-    creds = Credentials(**credentials_dict); gmail_service = build('gmail', 'v1', credentials=creds)
-    initial_template = campaign_templates[0]
-    email_body = initial_template['body'].replace("{dr_name}", contact_name).replace("{name}", contact_name)
-    thread_id = send_gmail_message(gmail_service, contact_email, initial_template['subject'], email_body)
-    if thread_id:
-        start_time_iso = datetime.utcnow().isoformat()
-        update_sheet_task.delay(credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, {"Send Status": "INITIAL_SENT", "Thread ID": thread_id, "Follow-up Count": 0, "Wait Period Start Time": start_time_iso})
-        check_frequency_seconds = calculate_seconds(check_frequency_value, check_frequency_unit)
-        check_for_reply.apply_async(args=[credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, contact_name, thread_id, 0, num_followups, total_wait_time_value, total_wait_time_unit, check_frequency_value, check_frequency_unit, start_time_iso, campaign_templates, use_random_followups], countdown=check_frequency_seconds)
+def send_contact_batch(campaign_id, contact_ids, attempt=0):
+    settings = get_campaign_settings(campaign_id); sender_email = settings['sender_email']
+    # Claim the rows first, so a duplicate or overlapping batch for the same contacts sends nothing.
+    claimed_at = datetime.utcnow()
+    claimed = Contact.query.filter(Contact.id.in_(contact_ids), Contact.status == 'PENDING').update({'status': 'SENDING', 'claimed_at': claimed_at}, synchronize_session=False); db.session.commit()
+    if not claimed: return
+    contacts = Contact.query.filter(Contact.id.in_(contact_ids), Contact.status == 'SENDING', Contact.claimed_at == claimed_at).order_by(Contact.id).all()
+    initial_template = settings['templates'][0]
+    messages = []
+    for contact in contacts:
+        fields = json.loads(contact.fields or '{}') or contact_fields({}, contact.name, contact.email)
+        messages.append((str(contact.id), contact.email, render_compiled(initial_template['subject'], fields), render_compiled(initial_template['body'], fields)))
+    release_connection(*contacts)
+    try: throttle('gmail_send', sender_email, len(messages))
+    except RateLimited as e:
+        for contact in contacts: contact.status = 'PENDING'
+        db.session.commit(); retry_send_batch(campaign_id, contact_ids, attempt, e.wait); return
+    thread_ids, failures = send_gmail_batch(get_gmail_service(settings['credentials']), sender_email, messages, SEND_BATCH_SIZE)
+    # Contacts Gmail throttled go back to PENDING and are sent again once Google's
+    # Retry-After (or the bucket's backoff) has passed, however many tries it takes.
+    throttled = {key for key, error in failures.items() if is_quota_error(error)}
+    if throttled: report_quota_error('gmail_send', sender_email)
+    elif thread_ids: report_success('gmail_send', sender_email)
+    start_time = datetime.utcnow(); row_updates = {}; watched = {}; scheduled_checks = []; retry_ids = []
+    for contact in contacts:
+        thread_id = thread_ids.get(str(contact.id))
+        if not thread_id and str(contact.id) in throttled: contact.status = 'PENDING'; retry_ids.append(contact.id); continue
+        sheet_updates = row_updates.setdefault(contact.sheet_name, {})
+        if not thread_id:
+            contact.status = 'SEND_FAILED'
+            sheet_updates[contact.email] = {"Send Status": "SEND_FAILED", "Send Error": str(failures.get(str(contact.id), "Unknown error"))}; continue
+        contact.thread_id = thread_id; contact.status = 'INITIAL_SENT'; contact.wait_started_at = start_time
+        sheet_updates[contact.email] = {"Send Status": "INITIAL_SENT", "Thread ID": thread_id, "Follow-up Count": 0, "Wait Period Start Time": start_time.isoformat()}
+        watched[thread_id] = contact.id
+        scheduled_checks.append(new_action(check_for_reply.name, [contact.id, 0], delay_seconds=settings['total_wait_seconds'], key=reply_check_key(contact.id)))
+    schedule_tasks(scheduled_checks); db.session.commit()
+    # Retry the throttled contacts before anything below can fail and strand them as PENDING.
+    if retry_ids: retry_send_batch(campaign_id, retry_ids, attempt + 1, max([backoff_seconds('gmail_send', sender_email, len(retry_ids))] + [quota_retry_seconds(failures[key]) for key in throttled]))
+    failed_emails = [contact.email for contact in contacts if contact.status == 'SEND_FAILED']
+    release_addresses(sender_email, failed_emails); record_contacts('sent', len(thread_ids)); record_contacts('send_failed', len(failed_emails))
+    record_progress(campaign_id, sent=len(thread_ids), failed=len(failed_emails))
+    watch_threads(sender_email, watched)
+    for sheet_name, sheet_updates in row_updates.items(): queue_sheet_updates(campaign_id, sheet_name, sheet_updates)
+    if thread_ids: schedule_reply_scan(campaign_id, sender_email, settings['check_frequency_seconds'])
+    print(f"Batch for campaign {campaign_id}: {len(thread_ids)} sent, {len(retry_ids)} throttled, {len(contacts) - len(thread_ids) - len(retry_ids)} failed.")
+    publish_fair_share()
+
+def release_connection(*rows):
+    """Give this thread's database connection back to the pool before a slow Google call or rate-limit sleep.
+
+    `rows` stay attached to the session, so later changes to them are still saved.
+    """
+    db.session.close(); db.session.add_all(rows)
+
+def retry_send_batch(campaign_id, contact_ids, attempt, wait):
+    if wait <= SEND_COUNTDOWN_MAX: send_contact_batch.apply_async(args=[campaign_id, contact_ids], kwargs={'attempt': attempt}, countdown=wait)
+    else: schedule_task(send_contact_batch.name, [campaign_id, contact_ids], {'attempt': attempt}, delay_seconds=wait); print(f"Campaign {campaign_id}: {len(contact_ids)} throttled sends parked for {wait:.0f}s.")
+
+def classify_new_messages(gmail_service, sender_email, contact_id, message_ids, ignored):
+    """Classify the thread's messages after our last sent one from their headers.
+
+    Returns ('reply', message ID), ('bounce', message ID) or (None, None).
+    Auto-replies and delay notices are remembered so later checks skip them.
+    """
+    bounce_id = None; skipped = []
+    try:
+        for message_id in reversed(message_ids):
+            if message_id in ignored: continue
+            throttle('gmail_read', sender_email); message = get_message_metadata(gmail_service, message_id, CLASSIFY_HEADERS)
+            if 'SENT' in message.get('labelIds', []): break
+            kind = classify_message(message)
+            if kind == 'reply': return 'reply', message_id
+            if kind == 'bounce': bounce_id = bounce_id or message_id
+            else: skipped.append(message_id)
+    finally: ignore_messages(contact_id, skipped)
+    return ('bounce', bounce_id) if bounce_id else (None, None)
+
+def mark_bounced(contact, sender_email):
+    """End a contact whose address bounced; callers suppress the address."""
+    unwatch_thread(sender_email, contact.thread_id); cancel_scheduled(reply_check_key(contact.id))
+    contact.status = 'BOUNCED'; db.session.commit(); record_contacts('bounced'); record_progress(contact.campaign_id, bounced=1)
+    queue_sheet_updates(contact.campaign_id, contact.sheet_name, {contact.email: {"Send Status": "BOUNCED"}})
 
 @celery.task
-def check_for_reply(credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, contact_name, thread_id, followups_sent, num_followups, total_wait_time_value, total_wait_time_unit, check_frequency_value, check_frequency_unit, start_time_iso, campaign_templates, use_random_followups):
-    creds = Credentials(**credentials_dict); gmail_service = build('gmail', 'v1', credentials=creds)
+def check_for_reply(contact_id, followups_sent, from_scan=False, message_ids=None):
+    # scan_mailbox_replies calls in with from_scan=True and the thread's message
+    # IDs when the thread receives new mail; the scheduled call fires once the
+    # wait period is over and probes the thread itself. Calls for an earlier
+    # follow-up stage or a finished contact are stale and ignored. New messages
+    # are classified from their headers first: bounces end the contact,
+    # auto-replies are skipped and only a real reply is downloaded in full.
+    contact = db.session.get(Contact, contact_id)
+    if contact is None or contact.followups_sent != followups_sent or contact.status in FINISHED_STATUSES: return
+    settings = get_campaign_settings(contact.campaign_id); sender_email = settings['sender_email']
+    gmail_service = get_gmail_service(settings['credentials']); check_key = reply_check_key(contact.id); api = 'gmail_read'
+    release_connection(contact)
     try:
-        thread = gmail_service.users().threads().get(userId='me', id=str(thread_id), format='full').execute()
-        if len(thread['messages']) > (followups_sent + 1):
-            last_message = thread['messages'][-1]
+        if not message_ids:
+            throttle('gmail_read', sender_email); message_ids = get_thread_message_ids(gmail_service, str(contact.thread_id))
+        ignored = ignored_messages(contact.id); outcome, new_message_id = None, None
+        if len(message_ids) > followups_sent + 1 + len(ignored.intersection(message_ids)):
+            outcome, new_message_id = classify_new_messages(gmail_service, sender_email, contact.id, message_ids, ignored)
+        if outcome == 'reply':
+            unwatch_thread(sender_email, contact.thread_id)
+            throttle('gmail_read', sender_email); last_message = get_message(gmail_service, new_message_id)
             reply_content = clean_reply_content(get_reply_body(last_message['payload']))
-            analyzer = SentimentIntensityAnalyzer(); score = analyzer.polarity_scores(reply_content)['compound']
-            sentiment = "Positive" if score >= 0.05 else "Negative" if score <= -0.05 else "Neutral"
-            update_sheet_task.delay(credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, { "Send Status": "REPLIED", "Reply Content": reply_content, "Reply Sentiment": sentiment })
+            contact.status = 'REPLIED'; cancel_scheduled(check_key)
+            queue_sheet_updates(contact.campaign_id, contact.sheet_name, {contact.email: {"Send Status": "REPLIED", "Reply Content": reply_content}})
+            queue_sentiment_scoring(contact.id, reply_content); record_contacts('replied'); record_progress(contact.campaign_id, replied=1)
+        elif outcome == 'bounce':
+            mark_bounced(contact, sender_email); suppress_addresses(sender_email, [contact.email], 'BOUNCED')
+        elif from_scan: return
         else:
-            start_time = datetime.fromisoformat(start_time_iso)
-            total_wait_seconds = calculate_seconds(total_wait_time_value, total_wait_time_unit)
-            if datetime.utcnow() < start_time + timedelta(seconds=total_wait_seconds):
-                check_frequency_seconds = calculate_seconds(check_frequency_value, check_frequency_unit)
-                check_for_reply.apply_async(args=[credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, contact_name, thread_id, followups_sent, num_followups, total_wait_time_value, total_wait_time_unit, check_frequency_value, check_frequency_unit, start_time_iso, campaign_templates, use_random_followups], countdown=check_frequency_seconds)
-            elif followups_sent < num_followups:
-                print(f"BACKGROUND TASK: Sending follow-up {followups_sent + 1} to {contact_email}")
-                email_template = None
-                if use_random_followups:
-                    all_templates = EmailTemplate.query.all()
-                    if all_templates: email_template = {'subject': random.choice(all_templates).subject, 'body': random.choice(all_templates).body}
+            total_wait_seconds = settings['total_wait_seconds']
+            wait_remaining = (contact.wait_started_at + timedelta(seconds=total_wait_seconds) - datetime.utcnow()).total_seconds()
+            if wait_remaining > 0:
+                schedule_task(check_for_reply.name, [contact.id, followups_sent], delay_seconds=wait_remaining, key=check_key)
+            elif contact.email and suppressed_addresses(sender_email, [contact.email]):
+                unwatch_thread(sender_email, contact.thread_id)
+                contact.status = 'SUPPRESSED'; db.session.commit(); record_contacts('suppressed'); record_progress(contact.campaign_id, suppressed=1)
+                queue_sheet_updates(contact.campaign_id, contact.sheet_name, {contact.email: {"Send Status": "SUPPRESSED"}})
+            elif followups_sent < settings['num_followups']:
+                print(f"BACKGROUND TASK: Sending follow-up {followups_sent + 1} to {contact.email}")
+                email_template = None; campaign_templates = settings['templates']
+                fields = json.loads(contact.fields or '{}') or contact_fields({}, contact.name, contact.email)
+                if settings['use_random_followups']: email_template = random_template(fields)
                 else:
                     template_index = followups_sent + 1
                     if len(campaign_templates) > template_index: email_template = campaign_templates[template_index]
                     else: email_template = campaign_templates[-1]
                 if not email_template:
-                    print(f"ERROR: Could not determine a template for follow-up for {contact_email}."); return
-                email_body = email_template['body'].replace("{dr_name}", contact_name).replace("{name}", contact_name)
-                send_gmail_message(gmail_service, contact_email, email_template['subject'], email_body)
-                new_followup_count = followups_sent + 1; new_start_time_iso = datetime.utcnow().isoformat()
-                update_sheet_task.delay(credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, {"Send Status": f"FOLLOWUP_{new_followup_count}_SENT", "Follow-up Count": new_followup_count, "Wait Period Start Time": new_start_time_iso})
-                check_frequency_seconds = calculate_seconds(check_frequency_value, check_frequency_unit)
-                check_for_reply.apply_async(args=[credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, contact_name, thread_id, new_followup_count, num_followups, total_wait_time_value, total_wait_time_unit, check_frequency_value, check_frequency_unit, new_start_time_iso, campaign_templates, use_random_followups], countdown=check_frequency_seconds)
+                    print(f"ERROR: Could not determine a template for follow-up for {contact.email}."); return
+                release_connection(contact); api = 'gmail_send'; throttle(api, sender_email)
+                try: send_message(gmail_service, sender_email, contact.email, render_compiled(email_template['subject'], fields), render_compiled(email_template['body'], fields))
+                except Exception as e:
+                    if is_quota_error(e): raise
+                    print(f"ERROR sending follow-up to {contact.email}: {e}")
+                    unwatch_thread(sender_email, contact.thread_id); contact.status = 'SEND_FAILED'; db.session.commit(); record_contacts('send_failed'); record_progress(contact.campaign_id, failed=1)
+                    queue_sheet_updates(contact.campaign_id, contact.sheet_name, {contact.email: {"Send Status": "SEND_FAILED", "Send Error": str(e)}}); return
+                new_followup_count = followups_sent + 1; new_start_time = datetime.utcnow()
+                contact.followups_sent = new_followup_count; contact.status = f"FOLLOWUP_{new_followup_count}_SENT"; contact.wait_started_at = new_start_time
+                schedule_task(check_for_reply.name, [contact.id, new_followup_count], delay_seconds=total_wait_seconds, key=check_key)
+                queue_sheet_updates(contact.campaign_id, contact.sheet_name, {contact.email: {"Send Status": f"FOLLOWUP_{new_followup_count}_SENT", "Follow-up Count": new_followup_count, "Wait Period Start Time": new_start_time.isoformat()}})
+                watch_thread(sender_email, contact.thread_id, contact.id); record_contacts('followup_sent'); record_progress(contact.campaign_id, followups_sent=1)
+                schedule_reply_scan(contact.campaign_id, sender_email, settings['check_frequency_seconds'])
             else:
-                update_sheet_task.delay(credentials_dict, g_sheet_id, contacts_sheet_name, contact_email, {"Send Status": "COMPLETED_NO_REPLY"})
-    except Exception as e: print(f"ERROR checking reply for {contact_email}: {e}")
+                unwatch_thread(sender_email, contact.thread_id)
+                contact.status = 'COMPLETED_NO_REPLY'; db.session.commit(); record_contacts('completed_no_reply'); record_progress(contact.campaign_id, completed=1)
+                queue_sheet_updates(contact.campaign_id, contact.sheet_name, {contact.email: {"Send Status": "COMPLETED_NO_REPLY"}})
+    except Exception as e:
+        if not isinstance(e, RateLimited) and not is_quota_error(e):
+            # The scheduled row was consumed when this check was dispatched, so put it back.
+            print(f"ERROR checking reply for {contact.email}: {e}"); db.session.rollback()
+            schedule_task(check_for_reply.name, [contact_id, followups_sent], delay_seconds=REPLY_CHECK_RETRY_SECONDS, key=check_key); return
+        # Throttled by our limiter or by Google: run the same check again later.
+        if isinstance(e, RateLimited): wait = e.wait
+        else: report_quota_error(api, sender_email); wait = backoff_seconds(api, sender_email)
+        check_for_reply.apply_async(args=[contact_id, followups_sent], kwargs={'from_scan': from_scan, 'message_ids': message_ids}, countdown=wait)
+
+@celery.task
+def dispatch_due_actions():
+    while True:
+        actions = claim_due_actions(SCHEDULER_BATCH_SIZE)
+        if not actions: return
+        # Reply checks go through their owner's fair queue; anything else is published directly.
+        contact_ids = [json.loads(action.args)[0] for action in actions if action.task_name == check_for_reply.name]
+        campaign_ids = dict(db.session.query(Contact.id, Contact.campaign_id).filter(Contact.id.in_(contact_ids))) if contact_ids else {}
+        reply_checks = {}
+        for action in actions:
+            args = json.loads(action.args); kwargs = json.loads(action.kwargs)
+            # The due time travels as a header so the task's start lag can be measured.
+            headers = {'scheduled_at': action.due_at.isoformat()}
+            if action.task_name == check_for_reply.name and args[0] in campaign_ids:
+                tenant = campaign_tenant(campaign_ids[args[0]])
+                reply_checks.setdefault(tenant, []).append((action.task_name, args, kwargs, headers))
+            else: celery.send_task(action.task_name, args=args, kwargs=kwargs, headers=headers)
+        for tenant, items in reply_checks.items(): enqueue('reply_check', tenant, items)
+        complete_actions(actions); publish_fair_share()
+        print(f"Dispatched {len(actions)} scheduled tasks.")
+        if len(actions) < SCHEDULER_BATCH_SIZE: return
+
+def campaign_tenant(campaign_id):
+    settings = get_campaign_settings(campaign_id)
+    return settings['user_email'] or settings['sender_email']
+
+def publish_fair_share():
+    """Move parked work onto the broker while its backlog is under FAIR_MAX_BACKLOG; one publisher at a time."""
+    lock = pump_lock()
+    if not lock.acquire(blocking=False): return 0
+    published = 0
+    try:
+        while True:
+            budget = FAIR_MAX_BACKLOG - redis_client.llen(IO_QUEUE)
+            taken = take_fair_share(budget) if budget > 0 else []
+            if not taken: return published
+            for index, (kind, tenant, items) in enumerate(taken):
+                for position, item in enumerate(items):
+                    try: celery.send_task(item['task'], args=item['args'], kwargs=item['kwargs'], headers=item['headers'])
+                    except Exception as e:
+                        print(f"ERROR publishing queued {kind} work for {tenant}: {e}")
+                        restore(kind, tenant, items[position:])
+                        for later_kind, later_tenant, later_items in taken[index + 1:]: restore(later_kind, later_tenant, later_items)
+                        return published
+                    published += 1
+    finally: lock.release()
+
+@celery.task
+def pump_fair_queues():
+    published = publish_fair_share()
+    if published: print(f"Published {published} queued tasks in fair-share order.")
+
+def schedule_reply_scan(campaign_id, sender_email, interval_seconds):
+    # One pending scan per mailbox, kept in scheduled_action like the reply checks
+    # rather than in a countdown the broker redelivers.
+    key = reply_scan_key(sender_email)
+    if is_scheduled(key): return
+    lock = scan_schedule_lock(sender_email)
+    if not lock.acquire(): return
+    try:
+        if not is_scheduled(key): schedule_task(scan_mailbox_replies.name, [campaign_id, interval_seconds], delay_seconds=interval_seconds, key=key)
+    finally: lock.release()
 
 @celery.task
-def update_sheet_task(credentials_dict, g_sheet_id, contacts_sheet_name, email, data_to_update):
-    creds = Credentials(**credentials_dict); gc = gspread.authorize(creds)
+def scan_mailbox_replies(campaign_id, interval_seconds):
+    settings = get_campaign_settings(campaign_id); sender_email = settings['sender_email']
+    if not count_watched_threads(sender_email): return
+    # Scheduling the next scan first keeps the chain alive if this run dies, and a
+    # duplicate delivery of this run finds it already scheduled.
+    schedule_reply_scan(campaign_id, sender_email, interval_seconds)
     try:
-        sheet = gc.open_by_key(g_sheet_id).worksheet(contacts_sheet_name)
-        cell = sheet.find(email)
-        if not cell: return
-        headers = sheet.row_values(1); header_map = {header: i for i, header in enumerate(headers)}
-        new_headers = [h for h in data_to_update.keys() if h not in header_map]
-        if new_headers:
-            new_header_cells = [gspread.Cell(1, len(headers) + i + 1, header) for i, header in enumerate(new_headers)]
-            sheet.update_cells(new_header_cells)
-            for header in new_headers: header_map[header] = len(headers); headers.append(header)
-        cells_to_update = []
-        for header, value in data_to_update.items():
-            cells_to_update.append(gspread.Cell(cell.row, header_map[header] + 1, str(value)))
-        if "Timestamp" not in header_map:
-             sheet.update_cell(1, len(headers) + 1, "Timestamp"); header_map["Timestamp"] = len(headers)
-        cells_to_update.append(gspread.Cell(cell.row, header_map["Timestamp"] + 1, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        sheet.update_cells(cells_to_update)
-    except Exception as e: print(f"ERROR updating sheet for {email}: {e}")
+        gmail_service = get_gmail_service(settings['credentials'])
+        start_history_id = get_history_checkpoint(sender_email)
+        if start_history_id: changed_thread_ids, latest_history_id = list_history_thread_ids(gmail_service, start_history_id)
+        else: changed_thread_ids, latest_history_id = None, get_profile(gmail_service)['historyId']
+        # Without a usable checkpoint every watched thread has to be checked once.
+        watched = get_watched_threads(sender_email, changed_thread_ids); replied = 0
+        if watched: throttle('gmail_read', sender_email, len(watched))
+        message_ids = get_thread_message_ids_batch(gmail_service, watched.keys()) if watched else {}
+        threads_by_contact = {contact_id: thread_id for thread_id, contact_id in watched.items()}; reply_checks = []
+        for contact_id, followups_sent in db.session.query(Contact.id, Contact.followups_sent).filter(Contact.id.in_(list(watched.values()))):
+            thread_message_ids = message_ids.get(threads_by_contact[contact_id])
+            # A failed probe is retried by check_for_reply on its own so the reply is not lost.
+            if thread_message_ids is None:
+                reply_checks.append((check_for_reply.name, [contact_id, followups_sent], {'from_scan': True}, None))
+            elif len(thread_message_ids) > followups_sent + 1:
+                reply_checks.append((check_for_reply.name, [contact_id, followups_sent], {'from_scan': True, 'message_ids': thread_message_ids}, None)); replied += 1
+        enqueue('reply_check', campaign_tenant(campaign_id), reply_checks); publish_fair_share()
+        set_history_checkpoint(sender_email, latest_history_id)
+        if watched: print(f"Mailbox scan for {sender_email}: {len(watched)} watched threads changed, {replied} with replies.")
+        # Mail arriving outside the watched threads may be a bounce for one of them.
+        if changed_thread_ids is None or set(changed_thread_ids) - set(watched): sweep_bounces(gmail_service, sender_email)
+    except Exception as e: print(f"ERROR scanning mailbox {sender_email} for replies: {e}")
+
+def sweep_bounces(gmail_service, sender_email):
+    """Find bounces delivered in their own thread and end the contacts named in X-Failed-Recipients."""
+    since = get_bounce_checkpoint(sender_email); swept_at = time.time()
+    throttle('gmail_read', sender_email)
+    message_ids = list_message_ids(gmail_service, f"{BOUNCE_SEARCH} after:{since}" if since else f"{BOUNCE_SEARCH} newer_than:7d")
+    recipients = set()
+    for message_id in message_ids:
+        throttle('gmail_read', sender_email); message = get_message_metadata(gmail_service, message_id, CLASSIFY_HEADERS)
+        if classify_message(message) == 'bounce': recipients.update(normalize_email(address) for address in failed_recipients(message))
+    if recipients:
+        contacts = Contact.query.join(Campaign).filter(Campaign.sender_email == sender_email, db.func.lower(Contact.email).in_(recipients), Contact.status.notin_(FINISHED_STATUSES)).all()
+        for contact in contacts: mark_bounced(contact, sender_email)
+        suppress_addresses(sender_email, recipients, 'BOUNCED')
+        print(f"Bounce sweep for {sender_email}: {len(recipients)} addresses bounced, {len(contacts)} contacts stopped.")
+    set_bounce_checkpoint(sender_email, swept_at)
+
+@celery.task
+def resume_campaign(campaign_id, requeue_pending=False):
+    """Rebuild a campaign's pending work from the database after a worker crash.
+
+    Unfinished worksheets are read on from their checkpoints unless a reader is
+    still running. Batches whose worker died mid-send (SENDING claims older
+    than SEND_CLAIM_TIMEOUT) go back to PENDING and are sent again; Gmail may
+    already have accepted some of them. Contacts waiting for a reply get their
+    reply check back (unless one is still scheduled) and their thread watched
+    again, and threads that were not being watched are probed in batches for
+    replies that arrived meanwhile. Send batches parked in the fair queues
+    survive a worker crash, so other PENDING contacts are only requeued with
+    requeue_pending, for when Redis itself was lost; send_contact_batch claims
+    its rows, so a batch that turns out to be a duplicate sends nothing.
+    """
+    campaign = db.session.get(Campaign, campaign_id)
+    if campaign is None: print(f"ERROR: Campaign {campaign_id} does not exist."); return None
+    summary = {'ingestion_resumed': False, 'sends_requeued': 0, 'checks_rescheduled': 0, 'threads_rewatched': 0, 'replies_found': 0}
+    stale = Contact.query.filter(Contact.campaign_id == campaign_id, Contact.status == 'SENDING', Contact.claimed_at < datetime.utcnow() - timedelta(seconds=SEND_CLAIM_TIMEOUT))
+    pending_ids = sorted(contact_id for (contact_id,) in stale.with_entities(Contact.id))
+    if pending_ids: Contact.query.filter(Contact.id.in_(pending_ids), Contact.status == 'SENDING').update({'status': 'PENDING'}, synchronize_session=False); db.session.commit()
+    # Taken before a new reader can save more contacts, whose batches it queues itself.
+    if requeue_pending: pending_ids = [contact_id for (contact_id,) in db.session.query(Contact.id).filter(Contact.campaign_id == campaign_id, Contact.status == 'PENDING').order_by(Contact.id)]
+    finished_sheets = {sheet_name for (sheet_name,) in db.session.query(CampaignCheckpoint.sheet_name).filter_by(campaign_id=campaign_id, finished=True)}
+    if (not campaign.sender_email or set(json.loads(campaign.column_mappings)) - finished_sheets) and not ingestion_lock(campaign_id).locked():
+        start_outreach_campaign.delay(campaign_id); summary['ingestion_resumed'] = True
+    if not campaign.sender_email: return summary
+    settings = get_campaign_settings(campaign_id); sender_email = settings['sender_email']; tenant = campaign_tenant(campaign_id)
+    enqueue('initial_send', tenant, [(send_contact_batch.name, [campaign_id, pending_ids[start:start + SEND_BATCH_SIZE]], None, None) for start in range(0, len(pending_ids), SEND_BATCH_SIZE)])
+    summary['sends_requeued'] = len(pending_ids)
+
+    waiting = db.session.query(Contact.id, Contact.thread_id, Contact.followups_sent, Contact.wait_started_at).filter(
+        Contact.campaign_id == campaign_id, Contact.thread_id.isnot(None), Contact.status.notin_(FINISHED_STATUSES + ('PENDING',))).order_by(Contact.id).all()
+    now = datetime.utcnow(); actions = []; by_thread = {}
+    for start in range(0, len(waiting), SCHEDULER_BATCH_SIZE):
+        chunk = waiting[start:start + SCHEDULER_BATCH_SIZE]
+        scheduled = {key for (key,) in db.session.query(ScheduledAction.key).filter(ScheduledAction.key.in_([reply_check_key(contact_id) for contact_id, *_ in chunk]))}
+        for contact_id, thread_id, followups_sent, wait_started_at in chunk:
+            by_thread[thread_id] = (contact_id, followups_sent)
+            if reply_check_key(contact_id) in scheduled: continue
+            due_in = ((wait_started_at or now) + timedelta(seconds=settings['total_wait_seconds']) - now).total_seconds()
+            actions.append(new_action(check_for_reply.name, [contact_id, followups_sent], delay_seconds=max(due_in, 0), key=reply_check_key(contact_id)))
+    schedule_tasks(actions); summary['checks_rescheduled'] = len(actions)
+
+    # Without a history checkpoint the next mailbox scan checks every watched thread anyway.
+    already_watched = get_watched_threads(sender_email, by_thread.keys())
+    unwatched = [thread_id for thread_id in by_thread if thread_id not in already_watched]
+    watch_threads(sender_email, {thread_id: contact_id for thread_id, (contact_id, _) in by_thread.items()}); summary['threads_rewatched'] = len(unwatched)
+    reply_checks = []
+    if unwatched and get_history_checkpoint(sender_email):
+        gmail_service = get_gmail_service(settings['credentials'])
+        try:
+            for start in range(0, len(unwatched), SCHEDULER_BATCH_SIZE):
+                chunk = unwatched[start:start + SCHEDULER_BATCH_SIZE]
+                throttle('gmail_read', sender_email, len(chunk))
+                for thread_id, message_ids in get_thread_message_ids_batch(gmail_service, chunk).items():
+                    contact_id, followups_sent = by_thread[thread_id]
+                    if len(message_ids) > followups_sent + 1: reply_checks.append((check_for_reply.name, [contact_id, followups_sent], {'from_scan': True, 'message_ids': message_ids}, None))
+        except RateLimited as e: print(f"Resuming campaign {campaign_id}: {e}; the remaining threads are left to their scheduled checks.")
+    enqueue('reply_check', tenant, reply_checks); summary['replies_found'] = len(reply_checks)
+    publish_fair_share()
+    if by_thread: schedule_reply_scan(campaign_id, sender_email, settings['check_frequency_seconds'])
+    print(f"Resumed campaign {campaign_id}: {summary}")
+    return summary
+
+def queue_sentiment_scoring(contact_id, reply_content):
+    pending = queue_reply(contact_id, reply_content)
+    if pending == SENTIMENT_BATCH_SIZE: score_pending_replies.delay()
+    elif claim_scoring_slot(): score_pending_replies.apply_async(countdown=SENTIMENT_BATCH_INTERVAL)
+
+@celery.task
+def score_pending_replies():
+    release_scoring_slot()
+    while True:
+        items = take_pending_replies(SENTIMENT_BATCH_SIZE)
+        if not items: return
+        try:
+            labels = score_texts([item['text'] for item in items])
+            contacts = {contact.id: contact for contact in Contact.query.filter(Contact.id.in_([item['contact_id'] for item in items]))}
+            row_updates = {}; sentiment_counts = {}
+            for item, label in zip(items, labels):
+                contact = contacts.get(item['contact_id'])
+                if not contact: continue
+                row_updates.setdefault((contact.campaign_id, contact.sheet_name), {})[contact.email] = {"Reply Sentiment": label}
+                counts = sentiment_counts.setdefault(contact.campaign_id, {}); counts[label.lower()] = counts.get(label.lower(), 0) + 1
+            for (campaign_id, sheet_name), sheet_updates in row_updates.items(): queue_sheet_updates(campaign_id, sheet_name, sheet_updates)
+            for campaign_id, counts in sentiment_counts.items(): record_progress(campaign_id, **counts)
+            print(f"Scored sentiment for {len(items)} replies.")
+        except Exception as e:
+            restore_pending_replies(items); print(f"ERROR scoring reply sentiment: {e}")
+            if claim_scoring_slot(): score_pending_replies.apply_async(countdown=SENTIMENT_BATCH_INTERVAL)
+            return
+
+def queue_sheet_updates(campaign_id, contacts_sheet_name, row_updates):
+    if not row_updates: return
+    g_sheet_id = get_campaign_settings(campaign_id)['g_sheet_id']
+    pending = buffer_row_updates(g_sheet_id, contacts_sheet_name, row_updates)
+    if pending - len(row_updates) < SHEET_FLUSH_SIZE <= pending:
+        enqueue('sheet_write', campaign_tenant(campaign_id), [(flush_sheet_updates.name, [campaign_id, contacts_sheet_name], None, None)]); publish_fair_share()
+    elif claim_flush_slot(g_sheet_id, contacts_sheet_name):
+        flush_sheet_updates.apply_async(args=[campaign_id, contacts_sheet_name], countdown=SHEET_FLUSH_INTERVAL)
+
+@celery.task
+def flush_sheet_updates(campaign_id, contacts_sheet_name):
+    settings = get_campaign_settings(campaign_id); g_sheet_id = settings['g_sheet_id']
+    release_flush_slot(g_sheet_id, contacts_sheet_name)
+    lock = flush_lock(g_sheet_id, contacts_sheet_name)
+    if not lock.acquire():
+        if claim_flush_slot(g_sheet_id, contacts_sheet_name):
+            flush_sheet_updates.apply_async(args=[campaign_id, contacts_sheet_name], countdown=SHEET_FLUSH_INTERVAL)
+        return
+    try:
+        release_connection(); sheet = get_gspread_client(settings['credentials']).open_by_key(g_sheet_id).worksheet(contacts_sheet_name)
+        while True:
+            throttle('sheets_write', settings['sender_email'])
+            items = take_buffered_updates(g_sheet_id, contacts_sheet_name)
+            if not items: break
+            try: written = write_row_updates(sheet, merge_row_updates(items))
+            except Exception as e:
+                restore_buffered_updates(g_sheet_id, contacts_sheet_name, items)
+                if is_quota_error(e): report_quota_error('sheets_write', settings['sender_email'])
+                raise
+            report_success('sheets_write', settings['sender_email'])
+            print(f"Flushed {written} row updates to sheet '{contacts_sheet_name}'.")
+    except Exception as e:
+        print(f"ERROR flushing updates for sheet '{contacts_sheet_name}': {e}")
+        if claim_flush_slot(g_sheet_id, contacts_sheet_name):
+            flush_sheet_updates.apply_async(args=[campaign_id, contacts_sheet_name], countdown=SHEET_FLUSH_INTERVAL)
+    finally: lock.release()
+
+@celery.task
+def refresh_drive_listing(user_email, credentials_dict):
+    try:
+        files = list_all_spreadsheets(get_drive_service(credentials_dict)); store_listing(user_email, files)
+        print(f"Cached {len(files)} Google Sheets for {user_email}.")
+    except Exception as e:
+        print(f"ERROR listing Google Sheets for {user_email}: {e}"); release_refresh(user_email, retry_after=30); return
+    release_refresh(user_email)
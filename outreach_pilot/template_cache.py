@@ -0,0 +1,47 @@
+import os
+import time
+import random
+from .extensions import db
+from .models import CacheVersion, EmailTemplate
+from .renderer import compile_template, template_fields
+
+# In-process copy of the email template library. Every change to the library
+# bumps the 'email_templates' row of cache_version in the same transaction;
+# readers keep the templates in memory and only reload them when that version
+# differs from the one they loaded, checking it at most every
+# TEMPLATE_CACHE_CHECK_SECONDS.
+TEMPLATE_CACHE_CHECK_SECONDS = float(os.environ.get('TEMPLATE_CACHE_CHECK_SECONDS', 5))
+CACHE_NAME = 'email_templates'
+_cache = {'version': None, 'templates': (), 'checked_at': 0.0}
+
+def current_version():
+    return db.session.query(CacheVersion.version).filter_by(name=CACHE_NAME).scalar() or 0
+
+def bump_template_version():
+    """Mark the template library as changed; call before committing the change."""
+    if not CacheVersion.query.filter_by(name=CACHE_NAME).update({CacheVersion.version: CacheVersion.version + 1}):
+        db.session.add(CacheVersion(name=CACHE_NAME, version=1))
+    _cache['checked_at'] = 0.0
+
+def get_templates():
+    """Return the template library as a tuple of dicts with id, subject, body and is_default."""
+    now = time.monotonic()
+    if now - _cache['checked_at'] >= TEMPLATE_CACHE_CHECK_SECONDS:
+        version = current_version()
+        if version != _cache['version']:
+            rows = EmailTemplate.query.order_by(EmailTemplate.id).all()
+            _cache['templates'] = tuple({'id': t.id, 'subject': t.subject, 'body': t.body, 'is_default': t.is_default} for t in rows)
+            _cache['version'] = version
+        _cache['checked_at'] = now
+    return _cache['templates']
+
+def random_template(fields=None):
+    """Pick one library template, compiled for rendering, or None if none fits.
+
+    With `fields`, only templates whose placeholders the contact can fill are considered.
+    """
+    templates = get_templates()
+    if fields is not None: templates = [t for t in templates if template_fields(t['subject']) | template_fields(t['body']) <= fields.keys()]
+    if not templates: return None
+    template = random.choice(templates)
+    return {'subject': compile_template(template['subject']), 'body': compile_template(template['body'])}
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 from outreach_pilot.models import EmailTemplate
 from outreach_pilot.extensions import db
+from outreach_pilot.template_cache import get_templates, bump_template_version
 from outreach_pilot.auth.utils import login_required
 
 templates_bp = Blueprint('template_manager', __name__)
@@ -8,7 +9,7 @@ templates_bp = Blueprint('template_manager', __name__)
 @templates_bp.route('/')
 @login_required
 def list_templates():
-    templates = EmailTemplate.query.all()
+    templates = get_templates()
     return render_template('templates.html', templates=templates)
 
 @templates_bp.route('/new')
@@ -24,7 +25,7 @@ def create_template():
     if subject and body:
         try:
             db.session.add(EmailTemplate(subject=subject, body=body, is_default=False))
-            db.session.commit()
+            bump_template_version(); db.session.commit()
             flash("New template created successfully!", "success")
         except Exception as e:
             db.session.rollback()
@@ -49,7 +50,7 @@ def update_template(template_id):
         try:
             template.subject = subject
             template.body = body
-            db.session.commit()
+            bump_template_version(); db.session.commit()
             flash('Template updated successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -68,7 +69,7 @@ def delete_template(template_id):
 
     try:
         db.session.delete(template)
-        db.session.commit()
+        bump_template_version(); db.session.commit()
         flash('Template deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
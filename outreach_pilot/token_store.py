@@ -0,0 +1,66 @@
+import os
+import hashlib
+from datetime import datetime, timedelta
+from google.oauth2.credentials import Credentials
+from .extensions import redis_client
+from .metrics import observe_call
+
+# Access tokens shared by the web app and every worker. Each grant (client ID +
+# refresh token) has one Redis hash holding the current access token and its
+# expiry; whoever finds it about to expire refreshes it under a Redis lock and
+# everyone else picks the new token up from the hash, so a grant is refreshed
+# once per token lifetime rather than once per process or task.
+TOKEN_REFRESH_MARGIN = int(os.environ.get('TOKEN_REFRESH_MARGIN', 300))
+TOKEN_LOCK_TIMEOUT = 30
+
+def credential_identity(credentials_dict):
+    secret = credentials_dict.get('refresh_token') or credentials_dict.get('token') or ''
+    return hashlib.sha256(f"{credentials_dict.get('client_id')}:{secret}".encode()).hexdigest()
+
+def token_key(credentials_dict):
+    return f"oauth_token:{credential_identity(credentials_dict)}"
+
+def read_token(credentials_dict):
+    """Return (token, expiry) from the store, or None."""
+    cached = redis_client.hgetall(token_key(credentials_dict))
+    if not cached.get('token'): return None
+    return cached['token'], datetime.fromisoformat(cached['expiry']) if cached.get('expiry') else None
+
+def store_token(credentials_dict, token, expiry):
+    key = token_key(credentials_dict)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(key); pipe.hset(key, mapping={'token': token, 'expiry': expiry.isoformat() if expiry else ''})
+    pipe.expire(key, max(int((expiry - datetime.utcnow()).total_seconds()), 1) if expiry else 3600)
+    pipe.execute()
+
+def is_fresh(cached):
+    return cached is not None and (cached[1] is None or cached[1] - datetime.utcnow() > timedelta(seconds=TOKEN_REFRESH_MARGIN))
+
+def refresh_shared_token(credentials_dict, request):
+    """Return a (token, expiry) that is good for at least TOKEN_REFRESH_MARGIN seconds, refreshing it at most once across all processes."""
+    cached = read_token(credentials_dict)
+    if is_fresh(cached): return cached
+    with redis_client.lock(f"{token_key(credentials_dict)}:lock", timeout=TOKEN_LOCK_TIMEOUT, blocking_timeout=TOKEN_LOCK_TIMEOUT):
+        cached = read_token(credentials_dict)
+        if is_fresh(cached): return cached
+        creds = Credentials(**credentials_dict)
+        with observe_call('oauth', 'token_refresh'): creds.refresh(request)
+        store_token(credentials_dict, creds.token, creds.expiry)
+        return creds.token, creds.expiry
+
+class SharedCredentials(Credentials):
+    """Credentials that refresh through the shared token store instead of calling Google directly."""
+    def refresh(self, request):
+        from google.auth.exceptions import RefreshError
+        try: self.token, self.expiry = refresh_shared_token(self._credentials_dict, request)
+        except RefreshError:
+            # The grant is revoked or expired; drop its pooled clients so they are not handed out again.
+            from .google_clients import invalidate_clients
+            invalidate_clients(self._credentials_dict); raise
+
+def shared_credentials(credentials_dict):
+    credentials_dict = {key: value for key, value in credentials_dict.items() if key != 'expiry'}
+    creds = SharedCredentials(**credentials_dict); creds._credentials_dict = credentials_dict
+    cached = read_token(credentials_dict)
+    if cached: creds.token, creds.expiry = cached
+    return creds